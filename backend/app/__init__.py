@@ -2,10 +2,12 @@
 Flask application factory
 """
 
-from flask import Flask
+from flask import Flask, request
 from flask_cors import CORS
+from flask_compress import Compress
 from flask_migrate import Migrate
 from .models import db
+from .utils.auth import firebase_config_present
 from .routes.guests import guests_bp
 from .routes.properties import properties_bp
 from .routes.contracts import contracts_bp
@@ -26,6 +28,7 @@ from .routes.smart_locks import smart_locks_bp
 from .routes.webhooks import webhooks_bp
 from .routes.reservation_passcodes import reservation_passcodes_bp
 from .routes.admin_testing import admin_testing_bp
+from .utils.json_provider import OrjsonProvider
 # Background jobs moved to dedicated worker scripts
 import os
 from datetime import datetime
@@ -33,10 +36,27 @@ from datetime import datetime
 def create_app():
     app = Flask(__name__)
     
+    # Serialize jsonify() responses with orjson
+    app.json = OrjsonProvider(app)
+    
     # Configure database
-    app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL')
+    database_url = os.getenv('DATABASE_URL')
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    # Pre-ping and recycle drop connections the server or a proxy closed
+    engine_options = {
+        'pool_pre_ping': True,
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', '1800')),
+    }
+    # Sized for the passcode sweeps and notification workers sharing each process.
+    # SQLite (local and test setups) uses pools that reject these arguments.
+    if not (database_url or '').startswith('sqlite'):
+        engine_options['pool_size'] = int(os.getenv('DB_POOL_SIZE', '20'))
+        engine_options['max_overflow'] = int(os.getenv('DB_MAX_OVERFLOW', '40'))
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options
     app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'a-super-secret-key-for-dev')
+    # Raise on unexpected relationship lazy loads in eager-loaded queries (dev/staging)
+    app.config['STRICT_LAZY_LOAD'] = os.getenv('STRICT_LAZY_LOAD', 'false').lower() == 'true'
     
     # Configure CORS
     allowed_origins = [
@@ -49,20 +69,34 @@ def create_app():
         r"/api/*": {
             "origins": allowed_origins,
             "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-            "allow_headers": ["Content-Type", "Authorization"],
-            "supports_credentials": True
+            "allow_headers": ["Content-Type", "Authorization", "X-Requested-With", "Accept"],
+            "supports_credentials": True,
+            "max_age": 86400  # Let browsers cache preflights for 24 hours
         },
         r"/*": {  # Fallback for any missing routes
             "origins": allowed_origins,
             "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-            "allow_headers": ["Content-Type", "Authorization"],
-            "supports_credentials": True
+            "allow_headers": ["Content-Type", "Authorization", "X-Requested-With", "Accept"],
+            "supports_credentials": True,
+            "max_age": 86400  # Let browsers cache preflights for 24 hours
         }
     })
     
+    # Answer every preflight before routing and auth run; Flask-CORS adds the
+    # Access-Control-* headers to this empty response on the way out
+    @app.before_request
+    def short_circuit_preflight():
+        if request.method == 'OPTIONS':
+            return '', 204
+    
+    # Compress JSON responses (brotli first, gzip fallback); tiny payloads aren't worth it
+    app.config['COMPRESS_ALGORITHM'] = ['br', 'gzip']
+    app.config['COMPRESS_MIN_SIZE'] = 1024
+    
     # Initialize extensions
     db.init_app(app)
     Migrate(app, db)
+    Compress(app)
     
     # Health check endpoint for Railway
     @app.route('/health')
@@ -102,6 +136,10 @@ def create_app():
     app.register_blueprint(reservation_passcodes_bp, url_prefix='/api')
     app.register_blueprint(admin_testing_bp)
 
+    # Firebase initializes lazily on the first token check; flag a missing config at deploy
+    if not firebase_config_present():
+        app.logger.warning("No Firebase credentials configured; authenticated routes will return 503")
+
     # Background job system removed - now runs in dedicated worker processes
     # Start workers with: python scripts/start_workers.py
 
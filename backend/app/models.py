@@ -26,9 +26,11 @@ class User(db.Model):
 
     # TTLock integration fields (encrypted)
     ttlock_username_encrypted = db.Column(db.Text, nullable=True)  # Encrypted TTLock username/phone
-    ttlock_password_encrypted = db.Column(db.Text, nullable=True)  # Encrypted TTLock password
+    ttlock_password_encrypted = db.Column(db.Text, nullable=True)  # Encrypted TTLock password (legacy rows only)
+    ttlock_password_md5_encrypted = db.Column(db.Text, nullable=True)  # Encrypted MD5 of the TTLock password
     ttlock_access_token = db.Column(db.Text, nullable=True)  # Current access token (temporary)
     ttlock_token_expires_at = db.Column(db.DateTime(timezone=True), nullable=True)  # Token expiration
+    ttlock_refresh_token_encrypted = db.Column(db.Text, nullable=True)  # Encrypted OAuth refresh token
     ttlock_uid = db.Column(db.Text, nullable=True)  # TTLock user ID
     ttlock_connected_at = db.Column(db.DateTime(timezone=True), nullable=True)  # When first connected
 
@@ -54,26 +56,35 @@ class User(db.Model):
         }
 
     def store_ttlock_credentials(self, username: str, password: str):
-        """Securely store TTLock credentials"""
-        from .utils.encryption import credential_encryption
+        """Securely store TTLock credentials (only the password's MD5, which is all TTLock needs)"""
+        from .utils.encryption import credential_encryption, ttlock_password_md5
 
         self.ttlock_username_encrypted = credential_encryption.encrypt(username)
-        self.ttlock_password_encrypted = credential_encryption.encrypt(password)
+        self.ttlock_password_md5_encrypted = credential_encryption.encrypt(ttlock_password_md5(password))
+        self.ttlock_password_encrypted = None
         self.ttlock_connected_at = datetime.now(timezone.utc)
 
     def get_ttlock_credentials(self):
-        """Retrieve and decrypt TTLock credentials"""
-        from .utils.encryption import credential_encryption
+        """Retrieve and decrypt TTLock credentials as (username, password_md5)"""
+        from .utils.encryption import credential_encryption, ttlock_password_md5
 
-        if not self.ttlock_username_encrypted or not self.ttlock_password_encrypted:
+        if not self.ttlock_username_encrypted:
             return None, None
 
         username = credential_encryption.decrypt(self.ttlock_username_encrypted)
-        password = credential_encryption.decrypt(self.ttlock_password_encrypted)
 
-        return username, password
+        if self.ttlock_password_md5_encrypted:
+            password_md5 = credential_encryption.decrypt(self.ttlock_password_md5_encrypted)
+        elif self.ttlock_password_encrypted:
+            # Stored before only the hash was kept
+            password = credential_encryption.decrypt(self.ttlock_password_encrypted)
+            password_md5 = ttlock_password_md5(password) if password else None
+        else:
+            return None, None
+
+        return username, password_md5
 
-    def update_ttlock_token(self, access_token: str, expires_in: int, uid: str = None):
+    def update_ttlock_token(self, access_token: str, expires_in: int, uid: str = None, refresh_token: str = None):
         """Update TTLock access token and expiration"""
         self.ttlock_access_token = access_token
         if expires_in:
@@ -81,19 +92,33 @@ class User(db.Model):
             self.ttlock_token_expires_at = datetime.now(timezone.utc) + timedelta(seconds=expires_in)
         if uid:
             self.ttlock_uid = uid
+        if refresh_token:
+            from .utils.encryption import credential_encryption
+            self.ttlock_refresh_token_encrypted = credential_encryption.encrypt(refresh_token)
+
+    def get_ttlock_refresh_token(self):
+        """Retrieve and decrypt the TTLock refresh token"""
+        if not self.ttlock_refresh_token_encrypted:
+            return None
+
+        from .utils.encryption import credential_encryption
+        return credential_encryption.decrypt(self.ttlock_refresh_token_encrypted)
 
-    def is_ttlock_token_valid(self):
-        """Check if TTLock access token is still valid"""
+    def is_ttlock_token_valid(self, margin_seconds: int = 0):
+        """Check if TTLock access token is still valid (for at least margin_seconds)"""
         if not self.ttlock_access_token or not self.ttlock_token_expires_at:
             return False
-        return datetime.now(timezone.utc) < self.ttlock_token_expires_at
+        from datetime import timedelta
+        return datetime.now(timezone.utc) + timedelta(seconds=margin_seconds) < self.ttlock_token_expires_at
 
     def clear_ttlock_credentials(self):
         """Clear all TTLock credentials"""
         self.ttlock_username_encrypted = None
         self.ttlock_password_encrypted = None
+        self.ttlock_password_md5_encrypted = None
         self.ttlock_access_token = None
         self.ttlock_token_expires_at = None
+        self.ttlock_refresh_token_encrypted = None
         self.ttlock_uid = None
         self.ttlock_connected_at = None
 
@@ -177,6 +202,9 @@ class Property(db.Model):
 class Reservation(db.Model):
     """Reservation/Booking model from calendar sync"""
     __tablename__ = 'reservations'
+    __table_args__ = (
+        db.Index('idx_reservations_status_check_in', 'status', 'check_in'),
+    )
     
     id = db.Column(UUID(as_uuid=True), primary_key=True, server_default=text('gen_random_uuid()'))
     property_id = db.Column(UUID(as_uuid=True), db.ForeignKey('properties.id'), nullable=False)
@@ -229,6 +257,10 @@ class Reservation(db.Model):
 class Guest(db.Model):
     """Guest information from verification process"""
     __tablename__ = 'guests'
+    __table_args__ = (
+        db.Index('idx_guests_reservation_id', 'reservation_id'),
+        db.Index('idx_guests_verification_token', 'verification_token'),
+    )
     
     id = db.Column(UUID(as_uuid=True), primary_key=True, server_default=text('gen_random_uuid()'))
     reservation_id = db.Column(UUID(as_uuid=True), db.ForeignKey('reservations.id'), nullable=False)
@@ -914,6 +946,19 @@ class SmartLock(db.Model):
 class ReservationPasscode(db.Model):
     """Passcodes generated for reservations"""
     __tablename__ = 'reservation_passcodes'
+    __table_args__ = (
+        # Partial index for the expired-passcode cleanup sweep
+        db.Index('idx_reservation_passcodes_active_valid_until', 'status', 'valid_until',
+                 postgresql_where=text("status = 'active'")),
+        # Partial index for the host notification history (newest first per property)
+        db.Index('idx_rp_property_notified', 'property_id', text('host_notified_at DESC'),
+                 postgresql_where=text('host_notified_at IS NOT NULL')),
+        # Partial index for the pending manual passcode listing
+        db.Index('idx_rp_pending_manual', 'property_id',
+                 postgresql_where=text("status = 'pending' AND generation_method = 'manual'")),
+        # One passcode row per reservation; also serves the reservation_id lookups
+        db.UniqueConstraint('reservation_id', name='uq_rp_reservation_id'),
+    )
 
     id = db.Column(UUID(as_uuid=True), primary_key=True, server_default=text('gen_random_uuid()'))
     reservation_id = db.Column(UUID(as_uuid=True), db.ForeignKey('reservations.id'), nullable=False)
@@ -954,6 +999,10 @@ class ReservationPasscode(db.Model):
 class AccessCode(db.Model):
     """Access codes/Passcodes for smart locks"""
     __tablename__ = 'access_codes'
+    __table_args__ = (
+        # Matching a password unlock to its code (webhooks and access log sync)
+        db.Index('idx_access_codes_lock_passcode_status', 'smart_lock_id', 'passcode', 'status'),
+    )
 
     id = db.Column(UUID(as_uuid=True), primary_key=True, server_default=text('gen_random_uuid()'))
     reservation_id = db.Column(UUID(as_uuid=True), db.ForeignKey('reservations.id'), nullable=False)
@@ -1002,6 +1051,10 @@ class AccessCode(db.Model):
 class AccessLog(db.Model):
     """Logs of smart lock access attempts and usage"""
     __tablename__ = 'access_logs'
+    __table_args__ = (
+        # One log per lock record; synced and webhook-delivered records upsert against it
+        db.UniqueConstraint('smart_lock_id', 'timestamp', name='uq_access_logs_lock_timestamp'),
+    )
 
     id = db.Column(UUID(as_uuid=True), primary_key=True, server_default=text('gen_random_uuid()'))
     smart_lock_id = db.Column(UUID(as_uuid=True), db.ForeignKey('smart_locks.id'), nullable=False)
@@ -13,7 +13,7 @@ from flask_cors import cross_origin
 
 calendar_bp = Blueprint('calendar', __name__)
 
-@calendar_bp.route('/calendar/test-ical/<path:ical_url>', methods=['GET', 'OPTIONS'])
+@calendar_bp.route('/calendar/test-ical/<path:ical_url>', methods=['GET'])
 @cross_origin()
 @require_auth
 def test_ical_url(ical_url):
@@ -45,7 +45,7 @@ def test_ical_url(ical_url):
             'error': f'Error validating iCal URL: {str(e)}'
         }), 400
 
-@calendar_bp.route('/calendar/sync/<property_id>', methods=['POST', 'OPTIONS'])
+@calendar_bp.route('/calendar/sync/<property_id>', methods=['POST'])
 @cross_origin()
 @require_auth
 def sync_calendar(property_id):
@@ -85,7 +85,7 @@ def sync_calendar(property_id):
             'error': f'Sync error: {str(e)}'
         }), 500
 
-@calendar_bp.route('/calendar/sync/status/<property_id>', methods=['GET', 'OPTIONS'])
+@calendar_bp.route('/calendar/sync/status/<property_id>', methods=['GET'])
 @cross_origin()
 @require_auth
 def get_sync_status(property_id):
@@ -124,7 +124,7 @@ def get_sync_status(property_id):
         'error': latest_log.errors
     })
 
-@calendar_bp.route('/calendar/sync-all', methods=['POST', 'OPTIONS'])
+@calendar_bp.route('/calendar/sync-all', methods=['POST'])
 @cross_origin()
 @require_auth
 def sync_all_calendars():
@@ -10,13 +10,11 @@ import logging
 
 contract_templates_bp = Blueprint('contract_templates', __name__, url_prefix='/contract-templates')
 
-@contract_templates_bp.route('', methods=['OPTIONS', 'GET'])
-@contract_templates_bp.route('/', methods=['OPTIONS', 'GET'])
+@contract_templates_bp.route('', methods=['GET'])
+@contract_templates_bp.route('/', methods=['GET'])
 @require_auth
 def get_contract_templates():
     """Get all contract templates for a user"""
-    if request.method == 'OPTIONS':
-        return '', 200
     try:
         logging.basicConfig(level=logging.DEBUG)
         logging.debug(f"g.user_id from token: {g.user_id}")
@@ -5,7 +5,7 @@ Contract management routes
 from flask import Blueprint, request, jsonify, g, send_file, current_app
 from ..models import db, Contract, Guest, MessageTemplate, ScheduledMessage, VerificationLink, Reservation, Property, ContractTemplate
 from ..utils.auth import require_auth
-from ..utils.database import get_user_by_firebase_uid
+from ..utils.database import get_user_by_firebase_uid, invalidate_verification_token
 from ..utils.sms import send_sms
 from ..utils.pdf_generator import generate_contract_pdf, generate_signed_contract_pdf
 from datetime import datetime, timedelta, timezone
@@ -96,6 +96,16 @@ def get_contract(contract_id):
         current_app.logger.error(f"Error fetching contract {contract_id}: {e}", exc_info=True)
         return jsonify({'success': False, 'error': "An unexpected error occurred"}), 500
 
+def _expire_stale_link(verification_link, token, now=None):
+    """Mark a signing link expired if it is past expires_at; returns True when expired"""
+    now = now or datetime.now(timezone.utc)
+    if verification_link.expires_at >= now:
+        return False
+    verification_link.status = 'expired'
+    db.session.commit()
+    invalidate_verification_token(token)
+    return True
+
 @contracts_bp.route('/sign/<token>', methods=['GET'])
 def get_contract_by_token(token):
     """Get contract details for signing using a token"""
@@ -111,9 +121,7 @@ def get_contract_by_token(token):
             return jsonify({'success': False, 'error': 'Invalid or expired signing link'}), 404
             
         # Check if link is expired
-        if verification_link.expires_at < datetime.now(timezone.utc):
-            verification_link.status = 'expired'
-            db.session.commit()
+        if _expire_stale_link(verification_link, token):
             return jsonify({'success': False, 'error': 'Signing link has expired'}), 410
             
         # Get guest and contract
@@ -182,10 +190,10 @@ def sign_contract_by_token(token):
         if not verification_link:
             return jsonify({'success': False, 'error': 'Invalid or expired signing link'}), 404
             
+        now = datetime.now(timezone.utc)
+
         # Check if link is expired
-        if verification_link.expires_at < datetime.now(timezone.utc):
-            verification_link.status = 'expired'
-            db.session.commit()
+        if _expire_stale_link(verification_link, token, now):
             return jsonify({'success': False, 'error': 'Signing link has expired'}), 410
 
         if verification_link.status == 'used':
@@ -207,13 +215,13 @@ def sign_contract_by_token(token):
         
         # Update contract with signature
         contract.contract_status = 'signed'
-        contract.signed_at = datetime.now(timezone.utc)
+        contract.signed_at = now
         contract.signature_data = signature_data
         contract.signature_ip = request.remote_addr
         
         # Update verification link
         verification_link.status = 'used'
-        verification_link.used_at = datetime.now(timezone.utc)
+        verification_link.used_at = now
         verification_link.contract_signed = True
         
         # Generate signed PDF
@@ -235,6 +243,7 @@ def sign_contract_by_token(token):
             send_sms(guest.phone, confirmation_message)
         
         db.session.commit()
+        invalidate_verification_token(token)
         
         return jsonify({
             'success': True,
@@ -469,11 +478,6 @@ def generate_contract_and_schedule_sms(guest_id):
             'error': "An unexpected error occurred while processing your request."
         }), 500
 
-@contracts_bp.route('/generate-and-schedule-sms/<guest_id>', methods=['OPTIONS'])
-def generate_contract_options(guest_id):
-    """Handle OPTIONS request for contract generation endpoint"""
-    return '', 200
-
 def populate_contract_variables(content, guest, contract):
     """Populate contract template variables"""
     reservation = guest.reservation
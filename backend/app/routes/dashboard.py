@@ -14,7 +14,7 @@ import uuid
 
 dashboard_bp = Blueprint('dashboard', __name__)
 
-@dashboard_bp.route('/stats', methods=['GET', 'OPTIONS'])
+@dashboard_bp.route('/stats', methods=['GET'])
 @cross_origin()
 @require_auth
 def get_dashboard_stats_route():
@@ -39,7 +39,7 @@ def get_dashboard_stats_route():
             'error': f'An unexpected error occurred: {str(e)}'
         }), 500
 
-@dashboard_bp.route('/recent-activity', methods=['GET', 'OPTIONS'])
+@dashboard_bp.route('/recent-activity', methods=['GET'])
 @cross_origin()
 @require_auth
 def get_recent_activity_route():
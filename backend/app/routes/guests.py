@@ -9,24 +9,12 @@ from datetime import datetime
 
 guests_bp = Blueprint('guests', __name__)
 
-# Add CORS support for all routes in this blueprint
-@guests_bp.after_request
-def after_request(response):
-    response.headers.add('Access-Control-Allow-Origin', 'http://localhost:3000')
-    response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
-    response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
-    return response
-
-@guests_bp.route('/guests/<guest_id>', methods=['PUT', 'OPTIONS'])
+@guests_bp.route('/guests/<guest_id>', methods=['PUT'])
 @require_auth
 def update_guest_route(guest_id):
     """
     Update a specific guest's information
     """
-    # Handle OPTIONS request for CORS
-    if request.method == 'OPTIONS':
-        return '', 204
-        
     try:
         # Get guest data
         guest_data = request.get_json()
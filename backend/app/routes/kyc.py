@@ -5,21 +5,15 @@ KYC (Know Your Customer) routes for Didit integration
 from flask import Blueprint, request, jsonify, current_app
 from ..models import db, Guest
 from ..utils.didit_kyc import didit_service
+from ..utils.database import get_verification_link
 from datetime import datetime
 import logging
+import uuid
 
 logger = logging.getLogger(__name__)
 
 kyc_bp = Blueprint('kyc', __name__)
 
-# Add CORS support
-@kyc_bp.after_request
-def after_request(response):
-    response.headers.add('Access-Control-Allow-Origin', '*')
-    response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
-    response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
-    return response
-
 @kyc_bp.route('/kyc/webhook', methods=['GET', 'POST'])
 def didit_webhook():
     """
@@ -278,16 +272,12 @@ def start_guest_kyc_verification(verification_token):
     """
     try:
         # Find guest by verification token
-        from ..models import VerificationLink
-        verification_link = VerificationLink.query.filter_by(
-            token=verification_token,
-            status='sent'
-        ).first()
+        link_info = get_verification_link(verification_token)
         
-        if not verification_link:
+        if not link_info or link_info['status'] != 'sent':
             return jsonify({'success': False, 'error': 'Invalid verification token'}), 404
         
-        guest = verification_link.guest
+        guest = db.session.get(Guest, uuid.UUID(link_info['guest_id']))
         if not guest:
             return jsonify({'success': False, 'error': 'Guest not found'}), 404
         
@@ -332,16 +322,12 @@ def get_guest_kyc_status(verification_token):
     """
     try:
         # Find guest by verification token
-        from ..models import VerificationLink
-        verification_link = VerificationLink.query.filter_by(
-            token=verification_token,
-            status='sent'
-        ).first()
+        link_info = get_verification_link(verification_token)
         
-        if not verification_link:
+        if not link_info or link_info['status'] != 'sent':
             return jsonify({'success': False, 'error': 'Invalid verification token'}), 404
         
-        guest = verification_link.guest
+        guest = db.session.get(Guest, uuid.UUID(link_info['guest_id']))
         if not guest:
             return jsonify({'success': False, 'error': 'Guest not found'}), 404
         
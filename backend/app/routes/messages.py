@@ -15,26 +15,6 @@ import uuid
 
 messages_bp = Blueprint('messages', __name__)
 
-# Add CORS support
-@messages_bp.after_request
-def after_request(response):
-    response.headers.add('Access-Control-Allow-Origin', 'http://localhost:3000')
-    response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
-    response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
-    return response
-
-# Handle OPTIONS requests for CORS
-@messages_bp.route('/templates', methods=['OPTIONS'])
-@messages_bp.route('/scheduled', methods=['OPTIONS'])
-@messages_bp.route('/scheduled/<message_id>/send', methods=['OPTIONS'])
-@messages_bp.route('/scheduled/<message_id>/cancel', methods=['OPTIONS'])
-def handle_options():
-    return '', 200
-
-@messages_bp.route('/templates/<template_id>', methods=['OPTIONS'])
-def handle_template_options(template_id):
-    return '', 200
-
 @messages_bp.route('/templates', methods=['GET'])
 @require_auth
 def get_templates():
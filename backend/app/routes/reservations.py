@@ -5,7 +5,7 @@ Reservation management routes for Hostify Property Management Platform
 from flask import Blueprint, request, jsonify, g
 from ..utils.database import (
     create_reservation, get_user_reservations, get_property_reservations,
-    get_user_by_firebase_uid, get_property
+    get_user_by_firebase_uid, get_property, get_reservation_for_user
 )
 from ..utils.auth import require_auth, get_current_user_id
 from ..models import SmartLock, AccessCode, db
@@ -283,9 +283,8 @@ def get_reservation(reservation_id):
         if not user:
             return jsonify({'success': False, 'error': 'User not found'}), 404
         
-        # Get all user reservations and find the requested one
-        reservations = get_user_reservations(user.id)
-        reservation = next((r for r in reservations if r['id'] == reservation_id), None)
+        # Look up the reservation directly, scoped to the user's properties
+        reservation = get_reservation_for_user(reservation_id, user.id)
         
         if not reservation:
             return jsonify({'success': False, 'error': 'Reservation not found or access denied'}), 404
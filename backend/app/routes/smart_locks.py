@@ -6,7 +6,7 @@ from flask import Blueprint, request, jsonify, g
 from ..models import SmartLock, AccessCode, AccessLog, Property, Reservation, db
 from ..utils.auth import require_auth
 from ..utils.database import get_user_by_firebase_uid
-from ..services.ttlock_service import ttlock_service
+from ..services.ttlock_service import get_ttlock_service, to_ttlock_ms
 from datetime import datetime, timezone
 import logging
 
@@ -37,8 +37,7 @@ def get_ttlock_connection_status():
         ttlock_username = None
         if is_connected and user.ttlock_username_encrypted:
             try:
-                credentials = user.get_ttlock_credentials()
-                ttlock_username = credentials['username'] if credentials else None
+                ttlock_username, _ = user.get_ttlock_credentials()
             except Exception:
                 pass  # Ignore decryption errors
 
@@ -77,7 +76,7 @@ def connect_ttlock_account():
             return jsonify({'success': False, 'error': 'TTLock app username and password required'}), 400
 
         # Authenticate with TTLock OAuth
-        auth_result = ttlock_service.authenticate_with_app_credentials(username, password)
+        auth_result = get_ttlock_service().authenticate_with_app_credentials(username, password)
 
         if auth_result['success']:
             # Store credentials securely for future use
@@ -85,11 +84,12 @@ def connect_ttlock_account():
             user.update_ttlock_token(
                 access_token=auth_result['access_token'],
                 expires_in=auth_result.get('expires_in', 3600),
-                uid=auth_result.get('uid')
+                uid=auth_result.get('uid'),
+                refresh_token=auth_result.get('refresh_token')
             )
 
             # Get locks from TTLock API
-            ttlock_locks = ttlock_service.get_locks()
+            ttlock_locks = get_ttlock_service().get_locks()
 
             stored_locks = []
             if ttlock_locks:
@@ -181,13 +181,11 @@ def test_ttlock_token():
         if not access_token:
             return jsonify({'success': False, 'error': 'access_token is required'}), 400
 
-        # Test access token
-        token_valid = ttlock_service.set_access_token(access_token)
-
-        if token_valid:
-            # Try to get locks list
-            locks = ttlock_service.get_locks()
+        # Test access token; the lock list call doubles as the check
+        get_ttlock_service().set_access_token(access_token)
+        locks = get_ttlock_service().validate_access_token()
 
+        if locks is not None:
             return jsonify({
                 'success': True,
                 'message': 'TTLock access token is valid',
@@ -261,7 +259,7 @@ def add_smart_lock(property_id):
             return jsonify({'success': False, 'error': 'Lock already exists in system'}), 409
 
         # Verify lock with TTLock API
-        lock_detail = ttlock_service.get_lock_detail(lock_data['ttlock_id'])
+        lock_detail = get_ttlock_service().get_lock_detail(lock_data['ttlock_id'])
         if not lock_detail:
             return jsonify({'success': False, 'error': 'Could not verify lock with TTLock API'}), 400
 
@@ -362,7 +360,7 @@ def remove_smart_lock(lock_id):
         ).all()
 
         for code in active_codes:
-            ttlock_service.revoke_guest_access(str(code.id))
+            get_ttlock_service().revoke_guest_access(str(code.id))
 
         # Delete the lock
         db.session.delete(smart_lock)
@@ -398,7 +396,7 @@ def sync_smart_lock(lock_id):
             return jsonify({'success': False, 'error': 'Smart lock not found or access denied'}), 404
 
         # Sync status
-        success = ttlock_service.sync_lock_status(smart_lock)
+        success = get_ttlock_service().sync_lock_status(smart_lock)
         if success:
             return jsonify({
                 'success': True,
@@ -456,7 +454,7 @@ def create_access_code(reservation_id):
 
         # Create passcode
         is_one_time = access_data.get('is_one_time', False)
-        access_code_id = ttlock_service.create_guest_passcode(
+        access_code_id = get_ttlock_service().create_guest_passcode(
             reservation_id=reservation_id,
             smart_lock_id=smart_lock_id,
             guest_name=guest_name,
@@ -501,7 +499,7 @@ def revoke_access_code(access_code_id):
             return jsonify({'success': False, 'error': 'Access code not found or access denied'}), 404
 
         # Revoke passcode
-        success = ttlock_service.revoke_guest_passcode(access_code_id)
+        success = get_ttlock_service().revoke_guest_passcode(access_code_id)
         if success:
             return jsonify({
                 'success': True,
@@ -579,7 +577,7 @@ def sync_access_logs(lock_id):
         days_back = min(max(days_back, 1), 30)  # Between 1 and 30 days
 
         # Sync logs
-        logs_synced = ttlock_service.sync_access_logs(smart_lock, days_back)
+        logs_synced = get_ttlock_service().sync_access_logs(smart_lock, days_back)
 
         return jsonify({
             'success': True,
@@ -611,17 +609,17 @@ def test_passcode(lock_id):
             return jsonify({'success': False, 'error': 'Smart lock not found or access denied'}), 404
 
         # Set user context for TTLock service
-        ttlock_service.set_user_context(user)
+        get_ttlock_service().set_user_context(user)
 
         # Generate test passcode (valid for 1 hour)
         from datetime import datetime, timezone, timedelta
         start_time = datetime.now(timezone.utc)
         end_time = start_time + timedelta(hours=1)
 
-        result = ttlock_service.generate_random_passcode(
+        result = get_ttlock_service().generate_random_passcode(
             lock_id=smart_lock.ttlock_id,
-            start_date=int(start_time.timestamp() * 1000),
-            end_date=int(end_time.timestamp() * 1000)
+            start_date=to_ttlock_ms(start_time),
+            end_date=to_ttlock_ms(end_time)
         )
 
         if result and result.get('success'):
@@ -648,7 +646,7 @@ def test_passcode(lock_id):
         # start_time = datetime.now(timezone.utc)
         # end_time = start_time + timedelta(hours=1)
         #
-        # result = ttlock_service.generate_random_passcode(
+        # result = get_ttlock_service().generate_random_passcode(
         #     lock_id=smart_lock.ttlock_id,
         #     start_date=int(start_time.timestamp() * 1000),
         #     end_date=int(end_time.timestamp() * 1000)
@@ -733,17 +731,17 @@ def sync_ttlock_locks():
             return jsonify({'success': False, 'error': 'TTLock account not connected or token expired'}), 401
 
         # Set user context for TTLock service
-        ttlock_service.set_user_context(user)
+        get_ttlock_service().set_user_context(user)
 
         # Ensure we have a valid access token
-        if not ttlock_service.ensure_authenticated():
+        if not get_ttlock_service().ensure_authenticated():
             return jsonify({'success': False, 'error': 'TTLock authentication failed. Please reconnect your account.'}), 401
 
         # Debug logging
-        logger.info(f"Syncing locks with access token: {ttlock_service.access_token[:20]}..." if ttlock_service.access_token else "No access token available")
+        logger.info(f"Syncing locks with access token: {get_ttlock_service().access_token[:20]}..." if get_ttlock_service().access_token else "No access token available")
 
         # Fetch locks from TTLock API
-        locks_data = ttlock_service.get_locks()
+        locks_data = get_ttlock_service().get_locks()
         if not locks_data:
             return jsonify({'success': False, 'error': 'Failed to fetch locks from TTLock API'}), 500
 
@@ -3,7 +3,10 @@ Webhook endpoints for third-party integrations
 """
 
 from flask import Blueprint, request, jsonify
-from ..services.ttlock_service import ttlock_service
+from ..services.ttlock_service import get_ttlock_service
+import os
+import base64
+import binascii
 import logging
 import hmac
 import hashlib
@@ -14,6 +17,26 @@ logger = logging.getLogger(__name__)
 
 webhooks_bp = Blueprint('webhooks', __name__)
 
+# Shared secret for signed TTLock webhooks, encoded once at import.
+# Signature checking is skipped when it is not configured.
+_TTLOCK_WEBHOOK_SECRET = os.getenv('TTLOCK_WEBHOOK_SECRET', '').encode()
+TTLOCK_SIGNATURE_HEADER = 'X-TTLock-Signature'
+
+# Write lock records off the request thread. Off by default: the queue is in memory,
+# so records still waiting when a worker restarts are lost.
+TTLOCK_WEBHOOK_ASYNC = os.getenv('TTLOCK_WEBHOOK_ASYNC', 'false').lower() == 'true'
+
+def verify_ttlock_signature(raw_data, signature):
+    """Check a base64 HMAC-SHA256 signature of the raw body in constant time"""
+    if not signature:
+        return False
+    try:
+        provided = base64.b64decode(signature, validate=True)
+    except (binascii.Error, ValueError):
+        return False
+    expected = hmac.new(_TTLOCK_WEBHOOK_SECRET, raw_data, hashlib.sha256).digest()
+    return hmac.compare_digest(expected, provided)
+
 @webhooks_bp.route('/webhooks/ttlock', methods=['POST'])
 def ttlock_webhook():
     """
@@ -21,33 +44,38 @@ def ttlock_webhook():
     This endpoint will be called when a lock is accessed
     """
     try:
-        # Log the raw request for debugging
-        raw_data = request.get_data()
-        content_type = request.content_type
-
-        logger.info(f"TTLock webhook received - Content-Type: {content_type}")
-        logger.info(f"TTLock webhook raw data: {raw_data}")
-
-        # Try to get JSON data
-        webhook_data = None
-        try:
-            webhook_data = request.get_json(force=True)
-        except Exception as json_error:
-            logger.warning(f"Failed to parse JSON: {json_error}")
-            # Try to get form data instead
-            webhook_data = request.form.to_dict()
+        # TTLock platform health checks post an empty body - answer before any parsing or logging
+        if not request.content_length:
+            return jsonify({'success': True, 'message': 'Webhook endpoint is working', 'received': ''})
+
+        if _TTLOCK_WEBHOOK_SECRET and not verify_ttlock_signature(
+                request.get_data(), request.headers.get(TTLOCK_SIGNATURE_HEADER)):
+            logger.warning("Rejected TTLock webhook with invalid signature")
+            return jsonify({'success': False, 'error': 'Invalid signature'}), 401
+
+        logger.debug("TTLock webhook received - Content-Type: %s", request.content_type)
+        logger.debug("TTLock webhook raw data: %r", request.get_data())
+
+        # Parse JSON once, falling back to form data
+        webhook_data = request.get_json(force=True, silent=True) or request.form.to_dict()
 
         if not webhook_data:
             logger.warning("No webhook data received")
             # For TTLock platform testing, return success even with no data
-            return jsonify({'success': True, 'message': 'Webhook endpoint is working', 'received': str(raw_data)})
+            return jsonify({'success': True, 'message': 'Webhook endpoint is working', 'received': str(request.get_data())})
 
-        logger.info(f"Parsed TTLock webhook data: {webhook_data}")
+        logger.debug("Parsed TTLock webhook data: %s", webhook_data)
 
         # Only process if we have actual lock data
-        if webhook_data and ('lockId' in webhook_data or 'records' in webhook_data):
+        if 'lockId' in webhook_data or 'records' in webhook_data:
+            logger.info("TTLock lock event received")
+
+            # Queue full: fall through and process inline
+            if TTLOCK_WEBHOOK_ASYNC and get_ttlock_service().enqueue_webhook_record(webhook_data):
+                return jsonify({'success': True, 'message': 'Webhook queued for processing'})
+
             # Process the webhook record
-            success = ttlock_service.process_webhook_record(webhook_data)
+            success = get_ttlock_service().process_webhook_record(webhook_data)
 
             if success:
                 return jsonify({'success': True, 'message': 'Webhook processed successfully'})
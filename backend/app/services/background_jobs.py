@@ -2,24 +2,36 @@
 Background job system for automated tasks
 """
 
-import threading
-import time
 import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone, timedelta
 from typing import Dict, List
+from apscheduler.schedulers.background import BackgroundScheduler
+from flask import current_app
+from sqlalchemy import update
 from ..models import Reservation, ReservationPasscode, Property, db
 from .passcode_service import passcode_service
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
+# Reservations whose passcodes are generated at once; each worker holds a DB connection
+# and waits on TTLock, so the sweep takes about as long as its slowest batch
+PASSCODE_GENERATION_MAX_WORKERS = int(os.getenv('PASSCODE_GENERATION_MAX_WORKERS', '5'))
+
 class BackgroundJobScheduler:
-    """Simple background job scheduler for automated tasks"""
+    """Background job scheduler for automated tasks, backed by APScheduler"""
 
-    def __init__(self):
-        self.running = False
-        self.thread = None
+    def __init__(self, app=None):
+        self.app = app
+        self.scheduler = None
         self.check_interval = 300  # Check every 5 minutes
+        self.cleanup_interval = 900  # Expired passcodes only need a 15 minute sweep
+
+    @property
+    def running(self) -> bool:
+        return bool(self.scheduler and self.scheduler.running)
 
     def start(self):
         """Start the background job scheduler"""
@@ -27,35 +39,40 @@ class BackgroundJobScheduler:
             logger.warning("Background job scheduler is already running")
             return
 
-        self.running = True
-        self.thread = threading.Thread(target=self._run_scheduler, daemon=True)
-        self.thread.start()
+        if self.app is None:
+            self.app = current_app._get_current_object()
+
+        self.scheduler = BackgroundScheduler(timezone=timezone.utc)
+        # max_instances=1 stops a slow tick from overlapping the next one,
+        # coalesce=True folds missed ticks into a single run
+        self.scheduler.add_job(
+            self._run_job, 'interval', args=[self._check_passcode_generation],
+            seconds=self.check_interval, id='passcode_generation',
+            max_instances=1, coalesce=True
+        )
+        self.scheduler.add_job(
+            self._run_job, 'interval', args=[self._cleanup_expired_passcodes],
+            seconds=self.cleanup_interval, id='passcode_cleanup',
+            max_instances=1, coalesce=True
+        )
+        self.scheduler.start()
         logger.info("Background job scheduler started")
 
     def stop(self):
-        """Stop the background job scheduler"""
-        self.running = False
-        if self.thread:
-            self.thread.join()
+        """Stop the background job scheduler, waiting for running jobs to finish"""
+        if self.running:
+            self.scheduler.shutdown(wait=True)
         logger.info("Background job scheduler stopped")
 
-    def _run_scheduler(self):
-        """Main scheduler loop"""
-        logger.info("Background job scheduler thread started")
-
-        while self.running:
+    def _run_job(self, job):
+        """Run a job in its own app context so it gets a fresh scoped session"""
+        with self.app.app_context():
             try:
-                # Run all scheduled jobs
-                self._check_passcode_generation()
-                self._cleanup_expired_passcodes()
-
-                # Sleep for the check interval
-                time.sleep(self.check_interval)
-
-            except Exception as e:
-                logger.error(f"Error in background job scheduler: {str(e)}")
-                # Continue running even if there's an error
-                time.sleep(60)  # Wait 1 minute before trying again
+                job()
+            finally:
+                # Return the connection to the pool between ticks instead of
+                # leaving it idle in transaction
+                db.session.remove()
 
     def _check_passcode_generation(self):
         """Check for reservations that need passcode generation"""
@@ -69,81 +86,85 @@ class BackgroundJobScheduler:
             # Find reservations that need passcode generation
             reservations_needing_passcodes = []
 
-            # Get reservations with check-in within the next 4 hours
-            upcoming_reservations = Reservation.query.filter(
+            # Get reservations with check-in within the next 4 hours that have no passcode yet,
+            # in one LEFT JOIN instead of a passcode lookup per reservation
+            upcoming_reservations = Reservation.query.outerjoin(
+                ReservationPasscode, ReservationPasscode.reservation_id == Reservation.id
+            ).filter(
                 Reservation.check_in > now,
                 Reservation.check_in <= cutoff_time,
-                Reservation.status.in_(['confirmed', 'checked_in'])  # Only process active reservations
+                Reservation.status.in_(['confirmed', 'checked_in']),  # Only process active reservations
+                ReservationPasscode.id.is_(None)
             ).all()
 
             for reservation in upcoming_reservations:
-                # Check if passcode already exists
-                existing_passcode = ReservationPasscode.query.filter_by(
-                    reservation_id=reservation.id
-                ).first()
-
-                if not existing_passcode:
-                    # Check if we should generate passcode (3 hours before check-in)
-                    if passcode_service.should_generate_passcode(reservation):
-                        reservations_needing_passcodes.append(reservation)
+                # Check if we should generate passcode (3 hours before check-in)
+                if passcode_service.should_generate_passcode(reservation, now):
+                    reservations_needing_passcodes.append(reservation)
 
             logger.info(f"Found {len(reservations_needing_passcodes)} reservations needing passcode generation")
 
-            # Generate passcodes for qualifying reservations
-            for reservation in reservations_needing_passcodes:
-                try:
-                    logger.info(f"Generating passcode for reservation {reservation.id}")
-                    result = passcode_service.generate_reservation_passcode(str(reservation.id))
-
-                    if result.get('success'):
-                        logger.info(f"Successfully generated passcode for reservation {reservation.id}")
+            # Generate passcodes for qualifying reservations. Work from ids so the session
+            # can be released before the sweep, then overlap the TTLock round trips of
+            # several reservations instead of waiting on each in turn.
+            reservation_ids = [str(reservation.id) for reservation in reservations_needing_passcodes]
+            db.session.remove()
 
-                        # SMS notifications are handled automatically by the passcode service
-                        if result.get('requires_manual_entry'):
-                            logger.info(f"Manual passcode entry required for reservation {reservation.id} - SMS sent to host")
+            if not reservation_ids:
+                return
 
-                    else:
-                        logger.error(f"Failed to generate passcode for reservation {reservation.id}: {result.get('error')}")
-
-                except Exception as e:
-                    logger.error(f"Error generating passcode for reservation {reservation.id}: {str(e)}")
+            with ThreadPoolExecutor(
+                max_workers=min(PASSCODE_GENERATION_MAX_WORKERS, len(reservation_ids)),
+                thread_name_prefix='passcode-generation'
+            ) as executor:
+                list(executor.map(self._generate_reservation_passcode, reservation_ids))
 
         except Exception as e:
             logger.error(f"Error in passcode generation check: {str(e)}")
 
-    def _cleanup_expired_passcodes(self):
-        """Clean up expired passcodes and update statuses"""
-        try:
-            logger.debug("Cleaning up expired passcodes")
-
-            now = datetime.now(timezone.utc)
+    def _generate_reservation_passcode(self, reservation_id: str):
+        """Generate one reservation's passcode in its own app context and session"""
+        with self.app.app_context():
+            try:
+                logger.info(f"Generating passcode for reservation {reservation_id}")
+                result = passcode_service.generate_reservation_passcode(reservation_id)
 
-            # Find expired passcodes that are still marked as active
-            expired_passcodes = ReservationPasscode.query.filter(
-                ReservationPasscode.valid_until < now,
-                ReservationPasscode.status == 'active'
-            ).all()
+                if result.get('success'):
+                    logger.info(f"Successfully generated passcode for reservation {reservation_id}")
 
-            if expired_passcodes:
-                logger.info(f"Found {len(expired_passcodes)} expired passcodes to clean up")
+                    # SMS notifications are handled automatically by the passcode service
+                    if result.get('requires_manual_entry'):
+                        logger.info(f"Manual passcode entry required for reservation {reservation_id} - SMS sent to host")
 
-                for passcode in expired_passcodes:
-                    try:
-                        # Update status to expired
-                        passcode.status = 'expired'
-                        passcode.updated_at = now
+                else:
+                    logger.error(f"Failed to generate passcode for reservation {reservation_id}: {result.get('error')}")
 
-                        # For TTLock passcodes, we could optionally revoke them from the API
-                        # but they should already be expired on TTLock's side
+            except Exception as e:
+                logger.error(f"Error generating passcode for reservation {reservation_id}: {str(e)}")
+            finally:
+                db.session.remove()
 
-                        logger.debug(f"Marked passcode {passcode.id} as expired")
+    def _cleanup_expired_passcodes(self):
+        """Clean up expired passcodes and update statuses"""
+        try:
+            logger.debug("Cleaning up expired passcodes")
 
-                    except Exception as e:
-                        logger.error(f"Error updating expired passcode {passcode.id}: {str(e)}")
+            now = datetime.now(timezone.utc)
 
-                # Commit all changes
-                db.session.commit()
-                logger.info(f"Successfully cleaned up {len(expired_passcodes)} expired passcodes")
+            # Expire every active passcode past its validity in a single UPDATE.
+            # TTLock passcodes should already be expired on TTLock's side.
+            result = db.session.execute(
+                update(ReservationPasscode)
+                .where(
+                    ReservationPasscode.valid_until < now,
+                    ReservationPasscode.status == 'active'
+                )
+                .values(status='expired', updated_at=now)
+            )
+            db.session.commit()
+
+            if result.rowcount:
+                logger.info(f"Successfully cleaned up {result.rowcount} expired passcodes")
 
         except Exception as e:
             logger.error(f"Error in passcode cleanup: {str(e)}")
@@ -154,7 +175,8 @@ class BackgroundJobScheduler:
         return {
             'running': self.running,
             'check_interval': self.check_interval,
-            'thread_alive': self.thread.is_alive() if self.thread else False
+            'cleanup_interval': self.cleanup_interval,
+            'jobs': [job.id for job in self.scheduler.get_jobs()] if self.running else []
         }
 
 # Background job system has been moved to dedicated worker processes
@@ -172,4 +194,5 @@ def init_background_jobs():
 def stop_background_jobs():
     """Background job system moved to dedicated workers - this function is now disabled"""
     logger.info("Background job system has been moved to dedicated worker processes")
-    # Do nothing - background jobs now run as separate processes
\ No newline at end of file
+    if background_scheduler:
+        background_scheduler.stop()
\ No newline at end of file
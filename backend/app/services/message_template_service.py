@@ -3,14 +3,101 @@ Enhanced message template service with smart lock integration
 """
 
 import logging
+import re
+import uuid
+from functools import lru_cache
+from types import MappingProxyType
 from datetime import datetime, timezone
-from typing import Dict, Optional
-from ..models import Reservation, ReservationPasscode, Property, MessageTemplate
+from typing import Dict, List, Mapping, Optional
+from flask import g, has_app_context
+from sqlalchemy import event
+from ..models import Reservation, ReservationPasscode, Property, MessageTemplate, db
 from ..services.passcode_service import passcode_service
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
+# Smart lock template variables with descriptions, shared read-only
+_AVAILABLE_SMART_LOCK_VARS = MappingProxyType({
+    'smart_lock_type': 'Type of smart lock system (ttlock, manual, traditional)',
+    'smart_lock_passcode': 'The passcode for smart lock access',
+    'smart_lock_instructions': 'Custom instructions for accessing the smart lock',
+    'access_method': 'Method of access (smart_lock or traditional)',
+    'lock_passcode_section': 'Complete formatted section with passcode details',
+    'smart_lock_details': 'Detailed information about smart lock access',
+    'passcode_valid_from': 'When the passcode becomes valid',
+    'passcode_valid_until': 'When the passcode expires'
+})
+
+# Matches every smart lock placeholder in one scan of the template
+_SMART_LOCK_PLACEHOLDER = re.compile(
+    r'\{(' + '|'.join(map(re.escape, _AVAILABLE_SMART_LOCK_VARS)) + r')\}'
+)
+
+# Constant variable sets, built once and shared read-only
+_EMPTY_SMART_LOCK_VARS = MappingProxyType({
+    'smart_lock_type': 'traditional',
+    'smart_lock_passcode': '',
+    'smart_lock_instructions': '',
+    'access_method': 'traditional',
+    'lock_passcode_section': '',
+    'smart_lock_details': '',
+    'passcode_valid_from': '',
+    'passcode_valid_until': ''
+})
+
+_TTLOCK_PENDING_VARS = MappingProxyType({
+    'smart_lock_passcode': '[Passcode will be provided]',
+    'passcode_valid_from': '',
+    'passcode_valid_until': '',
+    'lock_passcode_section': """
+🔒 SMART LOCK ACCESS
+Your smart lock passcode will be sent to you automatically 3 hours before your check-in time.""",
+    'smart_lock_details': """Your accommodation features smart lock access. You'll receive your unique passcode automatically before check-in.""",
+    'smart_lock_instructions': 'Smart lock passcode will be provided automatically before check-in.'
+})
+
+_MANUAL_PENDING_VARS = MappingProxyType({
+    'smart_lock_passcode': '[Passcode pending]',
+    'passcode_valid_from': '',
+    'passcode_valid_until': '',
+    'lock_passcode_section': """
+🔒 SMART LOCK ACCESS
+Your host will provide the smart lock passcode shortly. Please check for updates or contact your host if needed.""",
+    'smart_lock_details': """Your accommodation has smart lock access. Your host will provide the passcode details."""
+})
+
+_TRADITIONAL_ACCESS_VARS = MappingProxyType({
+    'smart_lock_type': 'traditional',
+    'smart_lock_passcode': '',
+    'access_method': 'traditional',
+    'passcode_valid_from': '',
+    'passcode_valid_until': '',
+    'lock_passcode_section': '',
+    'smart_lock_details': 'Traditional key access - your host will provide check-in instructions.'
+})
+
+@lru_cache(maxsize=1024)
+def _format_passcode_time(value: Optional[datetime]) -> str:
+    """Format a passcode validity bound for messages, memoized per datetime"""
+    return value.strftime('%I:%M %p on %b %d') if value else ''
+
+def _get_smart_lock_cache() -> Optional[Dict]:
+    """Per app-context cache of smart lock variables keyed by reservation id"""
+    if not has_app_context():
+        return None
+    if 'smart_lock_cache' not in g:
+        g.smart_lock_cache = {}
+    return g.smart_lock_cache
+
+@event.listens_for(ReservationPasscode, 'after_insert')
+@event.listens_for(ReservationPasscode, 'after_update')
+@event.listens_for(ReservationPasscode, 'after_delete')
+def _invalidate_smart_lock_cache(mapper, connection, target):
+    """Drop cached variables when a reservation's passcode changes"""
+    if has_app_context() and 'smart_lock_cache' in g:
+        g.smart_lock_cache.pop(str(target.reservation_id), None)
+
 class MessageTemplateService:
     """Enhanced message template service with smart lock support"""
 
@@ -19,53 +106,93 @@ class MessageTemplateService:
 
     def get_smart_lock_variables(self, reservation_id: str) -> Dict[str, str]:
         """
-        Get smart lock related template variables for a reservation
+        Get smart lock related template variables for a reservation.
+        Results are memoized on g for the lifetime of the app context.
         """
-        try:
-            reservation = Reservation.query.get(reservation_id)
-            if not reservation:
-                return self._get_empty_smart_lock_variables()
-
-            property_obj = Property.query.get(reservation.property_id)
-            if not property_obj:
-                return self._get_empty_smart_lock_variables()
+        return self.get_smart_lock_variables_bulk([reservation_id])[str(reservation_id)]
 
-            # Get smart lock configuration
-            lock_config = passcode_service.get_property_smart_lock_config(reservation.property_id)
+    def get_smart_lock_variables_bulk(self, reservation_ids: List[str]) -> Dict[str, Dict[str, str]]:
+        """
+        Get smart lock template variables for many reservations, keyed by reservation id.
+        Cache misses are loaded together in a fixed number of queries.
+        """
+        cache = _get_smart_lock_cache()
+        results = {}
+        missing = []
+        for reservation_id in reservation_ids:
+            cache_key = str(reservation_id)
+            if cache is not None and cache_key in cache:
+                results[cache_key] = dict(cache[cache_key])
+            else:
+                missing.append(cache_key)
 
-            # Get reservation passcode if it exists
-            reservation_passcode = ReservationPasscode.query.filter_by(
-                reservation_id=reservation_id
-            ).first()
+        if missing:
+            for cache_key, variables in self._load_smart_lock_variables_bulk(missing).items():
+                if cache is not None:
+                    cache[cache_key] = variables
+                results[cache_key] = dict(variables)
 
-            # Build smart lock variables based on property configuration
-            variables = {}
+        return results
 
-            if lock_config['type'] == 'ttlock':
-                variables.update(self._get_ttlock_variables(reservation_passcode, lock_config))
-            elif lock_config['type'] == 'manual':
-                variables.update(self._get_manual_lock_variables(reservation_passcode, lock_config))
-            else:  # traditional
-                variables.update(self._get_traditional_access_variables(lock_config))
+    def _load_smart_lock_variables_bulk(self, reservation_ids: List[str]) -> Dict[str, Mapping[str, str]]:
+        """Build smart lock variables for several reservations from the database"""
+        variables = {reservation_id: self._get_empty_smart_lock_variables() for reservation_id in reservation_ids}
+        try:
+            reservation_uuids = {}
+            for reservation_id in reservation_ids:
+                try:
+                    reservation_uuids[uuid.UUID(reservation_id)] = reservation_id
+                except ValueError:
+                    continue
+            if not reservation_uuids:
+                return variables
+
+            reservations = Reservation.query.filter(Reservation.id.in_(reservation_uuids)).all()
+
+            # Loading the properties up front also puts them in the identity map
+            # for get_property_smart_lock_config
+            property_ids = {reservation.property_id for reservation in reservations}
+            properties = {
+                property_obj.id: property_obj
+                for property_obj in Property.query.filter(Property.id.in_(property_ids)).all()
+            } if property_ids else {}
+
+            passcodes = {}
+            for reservation_passcode in ReservationPasscode.query.filter(
+                ReservationPasscode.reservation_id.in_(reservation_uuids)
+            ).all():
+                passcodes.setdefault(reservation_passcode.reservation_id, reservation_passcode)
+
+            for reservation in reservations:
+                if reservation.property_id not in properties:
+                    continue
+
+                # Get smart lock configuration
+                lock_config = passcode_service.get_property_smart_lock_config(reservation.property_id)
+
+                # Build smart lock variables based on property configuration
+                variables[reservation_uuids[reservation.id]] = self._build_smart_lock_variables(
+                    lock_config, passcodes.get(reservation.id)
+                )
 
             return variables
 
         except Exception as e:
-            logger.error(f"Failed to get smart lock variables: {str(e)}")
-            return self._get_empty_smart_lock_variables()
-
-    def _get_empty_smart_lock_variables(self) -> Dict[str, str]:
-        """Get empty smart lock variables when no smart lock is configured"""
-        return {
-            'smart_lock_type': 'traditional',
-            'smart_lock_passcode': '',
-            'smart_lock_instructions': '',
-            'access_method': 'traditional',
-            'lock_passcode_section': '',
-            'smart_lock_details': '',
-            'passcode_valid_from': '',
-            'passcode_valid_until': ''
-        }
+            logger.error("Failed to get smart lock variables: %s", e)
+            return variables
+
+    def _build_smart_lock_variables(self, lock_config: Dict, reservation_passcode: Optional[ReservationPasscode]) -> Dict[str, str]:
+        """Dispatch to the variable builder for the property's lock type"""
+        if lock_config['type'] == 'ttlock':
+            return self._get_ttlock_variables(reservation_passcode, lock_config)
+        elif lock_config['type'] == 'manual':
+            return self._get_manual_lock_variables(reservation_passcode, lock_config)
+        else:  # traditional
+            return self._get_traditional_access_variables(lock_config)
+
+    def _get_empty_smart_lock_variables(self) -> Mapping[str, str]:
+        """Get empty smart lock variables when no smart lock is configured (read-only)"""
+        return _EMPTY_SMART_LOCK_VARS
 
     def _get_ttlock_variables(self, reservation_passcode: Optional[ReservationPasscode], lock_config: Dict) -> Dict[str, str]:
         """Get variables for TTLock smart locks"""
@@ -76,8 +203,8 @@ class MessageTemplateService:
 
         if reservation_passcode and reservation_passcode.passcode:
             # Passcode is available
-            valid_from = reservation_passcode.valid_from.strftime('%I:%M %p on %b %d') if reservation_passcode.valid_from else ''
-            valid_until = reservation_passcode.valid_until.strftime('%I:%M %p on %b %d') if reservation_passcode.valid_until else ''
+            valid_from = _format_passcode_time(reservation_passcode.valid_from)
+            valid_until = _format_passcode_time(reservation_passcode.valid_until)
 
             variables.update({
                 'smart_lock_passcode': reservation_passcode.passcode,
@@ -89,29 +216,23 @@ Your passcode: {reservation_passcode.passcode}
 Valid from: {valid_from}
 Valid until: {valid_until}
 
-Simply enter this code on the smart lock keypad to unlock the door.""",
-                'smart_lock_details': f"""Your accommodation is equipped with a smart lock for keyless entry. Use passcode {reservation_passcode.passcode} to access the property."""
+Simply enter this code on the smart lock keypad to unlock the door."""
             })
+            details_parts = [f"Your accommodation is equipped with a smart lock for keyless entry. Use passcode {reservation_passcode.passcode} to access the property."]
 
             # Add custom instructions if available
-            if lock_config.get('instructions'):
-                variables['smart_lock_instructions'] = lock_config['instructions']
-                variables['smart_lock_details'] += f"\n\nAdditional instructions: {lock_config['instructions']}"
+            instructions = lock_config.get('instructions')
+            if instructions:
+                variables['smart_lock_instructions'] = instructions
+                details_parts.append(f"Additional instructions: {instructions}")
             else:
                 variables['smart_lock_instructions'] = "Enter the passcode on the smart lock keypad and wait for the green light before turning the handle."
 
+            variables['smart_lock_details'] = "\n\n".join(details_parts)
+
         else:
             # Passcode not yet available
-            variables.update({
-                'smart_lock_passcode': '[Passcode will be provided]',
-                'passcode_valid_from': '',
-                'passcode_valid_until': '',
-                'lock_passcode_section': """
-🔒 SMART LOCK ACCESS
-Your smart lock passcode will be sent to you automatically 3 hours before your check-in time.""",
-                'smart_lock_details': """Your accommodation features smart lock access. You'll receive your unique passcode automatically before check-in.""",
-                'smart_lock_instructions': 'Smart lock passcode will be provided automatically before check-in.'
-            })
+            variables.update(_TTLOCK_PENDING_VARS)
 
         return variables
 
@@ -124,8 +245,8 @@ Your smart lock passcode will be sent to you automatically 3 hours before your c
 
         if reservation_passcode and reservation_passcode.passcode:
             # Manual passcode has been set
-            valid_from = reservation_passcode.valid_from.strftime('%I:%M %p on %b %d') if reservation_passcode.valid_from else ''
-            valid_until = reservation_passcode.valid_until.strftime('%I:%M %p on %b %d') if reservation_passcode.valid_until else ''
+            valid_from = _format_passcode_time(reservation_passcode.valid_from)
+            valid_until = _format_passcode_time(reservation_passcode.valid_until)
 
             variables.update({
                 'smart_lock_passcode': reservation_passcode.passcode,
@@ -137,41 +258,29 @@ Your passcode: {reservation_passcode.passcode}
 Valid from: {valid_from}
 Valid until: {valid_until}
 
-Enter this code on the smart lock keypad to unlock the door.""",
-                'smart_lock_details': f"""Your host has configured a smart lock passcode for your stay: {reservation_passcode.passcode}"""
+Enter this code on the smart lock keypad to unlock the door."""
             })
+            details_parts = [f"Your host has configured a smart lock passcode for your stay: {reservation_passcode.passcode}"]
         else:
             # Manual passcode not yet set
-            variables.update({
-                'smart_lock_passcode': '[Passcode pending]',
-                'passcode_valid_from': '',
-                'passcode_valid_until': '',
-                'lock_passcode_section': """
-🔒 SMART LOCK ACCESS
-Your host will provide the smart lock passcode shortly. Please check for updates or contact your host if needed.""",
-                'smart_lock_details': """Your accommodation has smart lock access. Your host will provide the passcode details."""
-            })
+            variables.update(_MANUAL_PENDING_VARS)
+            details_parts = [_MANUAL_PENDING_VARS['smart_lock_details']]
 
         # Add custom instructions
-        if lock_config.get('instructions'):
-            variables['smart_lock_instructions'] = lock_config['instructions']
-            variables['smart_lock_details'] += f"\n\nInstructions: {lock_config['instructions']}"
+        instructions = lock_config.get('instructions')
+        if instructions:
+            variables['smart_lock_instructions'] = instructions
+            details_parts.append(f"Instructions: {instructions}")
         else:
             variables['smart_lock_instructions'] = "Enter the passcode on the smart lock keypad as instructed by your host."
 
+        variables['smart_lock_details'] = "\n\n".join(details_parts)
+
         return variables
 
     def _get_traditional_access_variables(self, lock_config: Dict) -> Dict[str, str]:
         """Get variables for traditional access methods"""
-        variables = {
-            'smart_lock_type': 'traditional',
-            'smart_lock_passcode': '',
-            'access_method': 'traditional',
-            'passcode_valid_from': '',
-            'passcode_valid_until': '',
-            'lock_passcode_section': '',
-            'smart_lock_details': 'Traditional key access - your host will provide check-in instructions.'
-        }
+        variables = dict(_TRADITIONAL_ACCESS_VARS)
 
         # Add custom instructions if available
         if lock_config.get('instructions'):
@@ -187,34 +296,28 @@ Your host will provide the smart lock passcode shortly. Please check for updates
         Populate smart lock variables in message template content
         """
         try:
+            # Templates that don't mention any smart lock placeholder need no lookups at all
+            if not _SMART_LOCK_PLACEHOLDER.search(content):
+                return content
+
             # Get smart lock variables
             smart_lock_vars = self.get_smart_lock_variables(reservation_id)
 
-            # Replace variables in content
-            for key, value in smart_lock_vars.items():
-                placeholder = '{' + key + '}'
-                content = content.replace(placeholder, str(value))
-
-            return content
+            # Replace all placeholders in a single pass; unknown values are left as-is
+            return _SMART_LOCK_PLACEHOLDER.sub(
+                lambda match: str(smart_lock_vars.get(match.group(1), match.group(0))),
+                content
+            )
 
         except Exception as e:
-            logger.error(f"Failed to populate smart lock variables: {str(e)}")
+            logger.error("Failed to populate smart lock variables: %s", e)
             return content
 
-    def get_available_smart_lock_variables(self) -> Dict[str, str]:
+    def get_available_smart_lock_variables(self) -> Mapping[str, str]:
         """
-        Get list of available smart lock template variables with descriptions
+        Get list of available smart lock template variables with descriptions (read-only)
         """
-        return {
-            'smart_lock_type': 'Type of smart lock system (ttlock, manual, traditional)',
-            'smart_lock_passcode': 'The passcode for smart lock access',
-            'smart_lock_instructions': 'Custom instructions for accessing the smart lock',
-            'access_method': 'Method of access (smart_lock or traditional)',
-            'lock_passcode_section': 'Complete formatted section with passcode details',
-            'smart_lock_details': 'Detailed information about smart lock access',
-            'passcode_valid_from': 'When the passcode becomes valid',
-            'passcode_valid_until': 'When the passcode expires'
-        }
+        return _AVAILABLE_SMART_LOCK_VARS
 
     def create_default_smart_lock_templates(self, user_id: str, property_id: str) -> list:
         """
@@ -272,9 +375,8 @@ Thank you for your stay! We hope to host you again soon.
                 }
             ]
 
-            created_templates = []
-            for template_data in templates_to_create:
-                template = MessageTemplate(
+            created_templates = [
+                MessageTemplate(
                     user_id=user_id,
                     property_id=property_id,
                     **template_data,
@@ -282,19 +384,18 @@ Thank you for your stay! We hope to host you again soon.
                     channels=['sms'],
                     active=True
                 )
+                for template_data in templates_to_create
+            ]
 
-                from ..models import db
-                db.session.add(template)
-                created_templates.append(template)
-
+            # One flush inserts every template in a single batched INSERT ... RETURNING
+            db.session.add_all(created_templates)
             db.session.commit()
-            logger.info(f"Created {len(created_templates)} default smart lock templates for property {property_id}")
+            logger.info("Created %d default smart lock templates for property %s", len(created_templates), property_id)
 
             return [template.to_dict() for template in created_templates]
 
         except Exception as e:
-            logger.error(f"Failed to create default smart lock templates: {str(e)}")
-            from ..models import db
+            logger.error("Failed to create default smart lock templates: %s", e)
             db.session.rollback()
             return []
 
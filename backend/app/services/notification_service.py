@@ -3,14 +3,83 @@ Notification service for smart lock integration
 """
 
 import logging
+import re
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timezone
-from typing import Dict, Optional
+from typing import Dict, List, Optional
+from flask import current_app
+from sqlalchemy import update
+from sqlalchemy.orm import raiseload
 from ..models import User, Property, Reservation, ReservationPasscode, db
 from ..utils.sms import send_sms
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
+# Everything that is not a digit or +
+_PHONE_STRIP_RE = re.compile(r'[^0-9+]')
+
+# SMS provider calls run here so callers don't wait on the Twilio round trip.
+# The pool size doubles as the cap on concurrent requests to the provider.
+SMS_MAX_CONCURRENT_SENDS = 8
+_sms_executor = ThreadPoolExecutor(max_workers=SMS_MAX_CONCURRENT_SENDS, thread_name_prefix='sms')
+
+def _on_sms_executor() -> bool:
+    """True on an _sms_executor thread, which must not wait on other SMS futures"""
+    return threading.current_thread().name.startswith('sms_')
+
+# Host SMS bodies
+_MANUAL_PASSCODE_TMPL = """🏠 Hostify - Manual Smart Lock Passcode Required
+
+Property: {property_name}
+Guest: {guest_name}
+Check-in: {check_in}
+
+Please set your smart lock passcode and update it in Hostify app:
+1. Go to Reservations → {guest_name}
+2. Click "Set Passcode"
+3. Enter the code you configured
+
+Passcode valid from 1hr before to 1hr after checkout.
+
+Need help? Reply to this message."""
+
+_TTLOCK_FAILURE_TMPL = """🔴 Hostify - Smart Lock Issue
+
+Property: {property_name}
+Guest: {guest_name}
+Check-in: {check_in}
+
+⚠️ Failed to generate automatic smart lock passcode.
+
+Error: {error}...
+
+Please:
+1. Check your TTLock connection in Hostify
+2. Or manually set a passcode
+3. Contact guest with access details
+
+Need help? Reply to this message."""
+
+_PASSCODE_READY_TMPL = """✅ Hostify - Smart Lock Passcode Ready
+
+Property: {property_name}
+Guest: {guest_name}
+Check-in: {check_in}
+
+🔒 Passcode: {passcode}
+Valid until: {valid_until}
+
+The passcode has been automatically set on your smart locks. Guest will receive access details in their check-in message.
+
+View in app: Hostify → Reservations → {guest_name}"""
+
+def _strict_lazy_load_options() -> list:
+    """raiseload('*') when STRICT_LAZY_LOAD is set, so a stray lazy load fails loudly instead of adding queries"""
+    return [raiseload('*')] if current_app.config.get('STRICT_LAZY_LOAD') else []
+
 class NotificationService:
     """Service for sending notifications related to smart locks"""
 
@@ -23,7 +92,7 @@ class NotificationService:
             return None
 
         # Remove any non-digit characters except +
-        cleaned = ''.join(c for c in phone if c.isdigit() or c == '+')
+        cleaned = _PHONE_STRIP_RE.sub('', phone)
 
         # If it already starts with +, return as is
         if cleaned.startswith('+'):
@@ -36,26 +105,102 @@ class NotificationService:
 
         return None
 
+    def enqueue(self, method_name: str, *args):
+        """
+        Run one of the send_* methods on the background executor.
+        Call it after committing: the worker loads the passcode in its own session.
+        """
+        app = current_app._get_current_object()
+        _sms_executor.submit(self._run_queued, app, method_name, *args)
+
+    def _run_queued(self, app, method_name: str, *args):
+        with app.app_context():
+            try:
+                result = getattr(self, method_name)(*args)
+                if not result.get('success'):
+                    logger.warning("Queued %s failed: %s", method_name, result.get('error'))
+            except Exception as e:
+                logger.error("Queued %s raised: %s", method_name, e)
+            finally:
+                db.session.remove()
+
+    def _dispatch_sms(self, phone_number: str, message: str, description: str, reservation_passcode_id=None):
+        """Queue an SMS on the background executor and return immediately"""
+        app = current_app._get_current_object()
+        _sms_executor.submit(
+            self._send_sms_and_record, app, phone_number, message, description, reservation_passcode_id
+        )
+
+    def _send_sms_and_record(self, app, phone_number: str, message: str, description: str, reservation_passcode_id=None) -> Dict:
+        """
+        Send an SMS and stamp host_notified_at on success.
+        Runs on the executor, so it opens its own app context and session.
+        """
+        sms_result = send_sms(phone_number, message)
+        if not sms_result.get('success'):
+            logger.error("Failed to send %s to %s: %s", description, phone_number, sms_result.get('error'))
+            return sms_result
+
+        logger.info("Sent %s to %s", description, phone_number)
+
+        if reservation_passcode_id:
+            with app.app_context():
+                try:
+                    db.session.execute(
+                        update(ReservationPasscode)
+                        .where(ReservationPasscode.id == reservation_passcode_id)
+                        .values(host_notified_at=datetime.now(timezone.utc))
+                    )
+                    db.session.commit()
+                except Exception as e:
+                    logger.error("Failed to record %s for passcode %s: %s", description, reservation_passcode_id, e)
+                    db.session.rollback()
+
+        return sms_result
+
+    def _passcode_context_query(self):
+        """Passcodes joined to their reservation, property and host"""
+        return db.session.query(ReservationPasscode, Reservation, Property, User).options(
+            *_strict_lazy_load_options()
+        ).join(
+            Reservation, Reservation.id == ReservationPasscode.reservation_id
+        ).join(
+            Property, Property.id == ReservationPasscode.property_id
+        ).join(
+            User, User.id == Property.user_id
+        )
+
+    def _load_passcode_context(self, reservation_passcode_id: str):
+        """
+        Load a passcode with its reservation, property and host in one query.
+        Returns (reservation_passcode, reservation, property, user) or None.
+        """
+        return self._passcode_context_query().filter(
+            ReservationPasscode.id == reservation_passcode_id
+        ).first()
+
+    def _load_reservation_context(self, reservation_id: str):
+        """
+        Load a reservation with its property and host in one query.
+        Returns (reservation, property, user) or None.
+        """
+        return db.session.query(Reservation, Property, User).join(
+            Property, Property.id == Reservation.property_id
+        ).join(
+            User, User.id == Property.user_id
+        ).filter(
+            Reservation.id == reservation_id
+        ).first()
+
     def send_manual_passcode_notification(self, reservation_passcode_id: str) -> Dict:
         """
         Send SMS notification to host requesting manual passcode entry
         """
         try:
-            reservation_passcode = ReservationPasscode.query.get(reservation_passcode_id)
-            if not reservation_passcode:
+            context = self._load_passcode_context(reservation_passcode_id)
+            if not context:
                 return {'success': False, 'error': 'Reservation passcode not found'}
-
-            reservation = Reservation.query.get(reservation_passcode.reservation_id)
-            if not reservation:
-                return {'success': False, 'error': 'Reservation not found'}
-
-            property_obj = Property.query.get(reservation_passcode.property_id)
-            if not property_obj:
-                return {'success': False, 'error': 'Property not found'}
-
-            user = User.query.get(property_obj.user_id)
-            if not user:
-                return {'success': False, 'error': 'Property owner not found'}
+            reservation_passcode, reservation, property_obj, user = context
 
             # Format phone number
             phone_number = self.format_phone_number(user.phone)
@@ -66,46 +211,27 @@ class NotificationService:
             check_in_str = reservation.check_in.strftime('%b %d at %I:%M %p') if reservation.check_in else 'TBD'
 
             # Create SMS message
-            guest_name = f"{reservation.first_name} {reservation.last_name}".strip()
-            message = f"""🏠 Hostify - Manual Smart Lock Passcode Required
-
-Property: {property_obj.name}
-Guest: {guest_name}
-Check-in: {check_in_str}
-
-Please set your smart lock passcode and update it in Hostify app:
-1. Go to Reservations → {guest_name}
-2. Click "Set Passcode"
-3. Enter the code you configured
-
-Passcode valid from 1hr before to 1hr after checkout.
-
-Need help? Reply to this message."""
-
-            # Send SMS
-            sms_result = send_sms(phone_number, message)
-
-            if sms_result.get('success'):
-                # Update notification timestamp
-                reservation_passcode.host_notified_at = datetime.now(timezone.utc)
-                db.session.commit()
-
-                logger.info(f"Sent manual passcode notification for reservation {reservation.id} to {phone_number}")
-
-                return {
-                    'success': True,
-                    'message': 'Manual passcode notification sent successfully',
-                    'sms_sid': sms_result.get('sid')
-                }
-            else:
-                return {
-                    'success': False,
-                    'error': f"Failed to send SMS: {sms_result.get('error')}"
-                }
+            guest_name = reservation.guest_name_partial or 'Guest'
+            message = _MANUAL_PASSCODE_TMPL.format(
+                property_name=property_obj.name,
+                guest_name=guest_name,
+                check_in=check_in_str
+            )
+
+            # Send SMS in the background; host_notified_at is recorded once it went out
+            self._dispatch_sms(
+                phone_number, message, 'manual passcode notification',
+                reservation_passcode_id=reservation_passcode.id
+            )
+
+            return {
+                'success': True,
+                'queued': True,
+                'message': 'Manual passcode notification queued'
+            }
 
         except Exception as e:
-            logger.error(f"Failed to send manual passcode notification: {str(e)}")
-            db.session.rollback()
+            logger.error("Failed to send manual passcode notification: %s", e)
             return {'success': False, 'error': str(e)}
 
     def send_ttlock_failure_notification(self, reservation_id: str, error_message: str) -> Dict:
@@ -113,17 +239,10 @@ Need help? Reply to this message."""
         Send SMS notification to host when TTLock passcode generation fails
         """
         try:
-            reservation = Reservation.query.get(reservation_id)
-            if not reservation:
+            context = self._load_reservation_context(reservation_id)
+            if not context:
                 return {'success': False, 'error': 'Reservation not found'}
-
-            property_obj = Property.query.get(reservation.property_id)
-            if not property_obj:
-                return {'success': False, 'error': 'Property not found'}
-
-            user = User.query.get(property_obj.user_id)
-            if not user:
-                return {'success': False, 'error': 'Property owner not found'}
+            reservation, property_obj, user = context
 
             # Format phone number
             phone_number = self.format_phone_number(user.phone)
@@ -134,43 +253,25 @@ Need help? Reply to this message."""
             check_in_str = reservation.check_in.strftime('%b %d at %I:%M %p') if reservation.check_in else 'TBD'
 
             # Create SMS message
-            guest_name = f"{reservation.first_name} {reservation.last_name}".strip()
-            message = f"""🔴 Hostify - Smart Lock Issue
-
-Property: {property_obj.name}
-Guest: {guest_name}
-Check-in: {check_in_str}
-
-⚠️ Failed to generate automatic smart lock passcode.
-
-Error: {error_message[:100]}...
-
-Please:
-1. Check your TTLock connection in Hostify
-2. Or manually set a passcode
-3. Contact guest with access details
-
-Need help? Reply to this message."""
-
-            # Send SMS
-            sms_result = send_sms(phone_number, message)
-
-            if sms_result.get('success'):
-                logger.info(f"Sent TTLock failure notification for reservation {reservation_id} to {phone_number}")
-
-                return {
-                    'success': True,
-                    'message': 'TTLock failure notification sent successfully',
-                    'sms_sid': sms_result.get('sid')
-                }
-            else:
-                return {
-                    'success': False,
-                    'error': f"Failed to send SMS: {sms_result.get('error')}"
-                }
+            guest_name = reservation.guest_name_partial or 'Guest'
+            message = _TTLOCK_FAILURE_TMPL.format(
+                property_name=property_obj.name,
+                guest_name=guest_name,
+                check_in=check_in_str,
+                error=error_message[:100]
+            )
+
+            # Send SMS in the background
+            self._dispatch_sms(phone_number, message, 'TTLock failure notification')
+
+            return {
+                'success': True,
+                'queued': True,
+                'message': 'TTLock failure notification queued'
+            }
 
         except Exception as e:
-            logger.error(f"Failed to send TTLock failure notification: {str(e)}")
+            logger.error("Failed to send TTLock failure notification: %s", e)
             return {'success': False, 'error': str(e)}
 
     def send_passcode_ready_notification(self, reservation_passcode_id: str) -> Dict:
@@ -178,110 +279,164 @@ Need help? Reply to this message."""
         Send SMS notification to host when TTLock passcode is successfully generated
         """
         try:
-            reservation_passcode = ReservationPasscode.query.get(reservation_passcode_id)
-            if not reservation_passcode:
+            context = self._load_passcode_context(reservation_passcode_id)
+            if not context:
                 return {'success': False, 'error': 'Reservation passcode not found'}
-
-            reservation = Reservation.query.get(reservation_passcode.reservation_id)
-            if not reservation:
-                return {'success': False, 'error': 'Reservation not found'}
-
-            property_obj = Property.query.get(reservation_passcode.property_id)
-            if not property_obj:
-                return {'success': False, 'error': 'Property not found'}
-
-            user = User.query.get(property_obj.user_id)
-            if not user:
-                return {'success': False, 'error': 'Property owner not found'}
+            reservation_passcode, reservation, property_obj, user = context
 
             # Format phone number
             phone_number = self.format_phone_number(user.phone)
             if not phone_number:
                 return {'success': False, 'error': 'Valid phone number not found for host'}
 
-            # Format dates
-            check_in_str = reservation.check_in.strftime('%b %d at %I:%M %p') if reservation.check_in else 'TBD'
-            valid_until_str = reservation_passcode.valid_until.strftime('%b %d at %I:%M %p') if reservation_passcode.valid_until else 'TBD'
+            message = self._format_passcode_ready_message(reservation_passcode, reservation, property_obj)
 
-            # Create SMS message
-            guest_name = f"{reservation.first_name} {reservation.last_name}".strip()
-            message = f"""✅ Hostify - Smart Lock Passcode Ready
+            # Send SMS in the background; host_notified_at is recorded once it went out
+            self._dispatch_sms(
+                phone_number, message, 'passcode ready notification',
+                reservation_passcode_id=reservation_passcode.id
+            )
 
-Property: {property_obj.name}
-Guest: {guest_name}
-Check-in: {check_in_str}
+            return {
+                'success': True,
+                'queued': True,
+                'message': 'Passcode ready notification queued'
+            }
 
-🔒 Passcode: {reservation_passcode.passcode}
-Valid until: {valid_until_str}
-
-The passcode has been automatically set on your smart locks. Guest will receive access details in their check-in message.
-
-View in app: Hostify → Reservations → {guest_name}"""
-
-            # Send SMS
-            sms_result = send_sms(phone_number, message)
+        except Exception as e:
+            logger.error("Failed to send passcode ready notification: %s", e)
+            return {'success': False, 'error': str(e)}
 
-            if sms_result.get('success'):
-                # Update notification timestamp
-                reservation_passcode.host_notified_at = datetime.now(timezone.utc)
+    def _format_passcode_ready_message(self, reservation_passcode, reservation, property_obj) -> str:
+        """Build the passcode ready SMS body"""
+        check_in_str = reservation.check_in.strftime('%b %d at %I:%M %p') if reservation.check_in else 'TBD'
+        valid_until_str = reservation_passcode.valid_until.strftime('%b %d at %I:%M %p') if reservation_passcode.valid_until else 'TBD'
+
+        guest_name = reservation.guest_name_partial or 'Guest'
+        return _PASSCODE_READY_TMPL.format(
+            property_name=property_obj.name,
+            guest_name=guest_name,
+            check_in=check_in_str,
+            passcode=reservation_passcode.passcode,
+            valid_until=valid_until_str
+        )
+
+    def send_bulk_passcode_ready_notifications(self, reservation_passcode_ids: List[str]) -> Dict:
+        """
+        Send passcode ready notifications for many passcodes at once.
+        Contexts are loaded in one query, SMS sends fan out over the SMS executor,
+        and host_notified_at is stamped for all delivered passcodes in one UPDATE.
+        """
+        try:
+            passcode_uuids = [uuid.UUID(str(passcode_id)) for passcode_id in reservation_passcode_ids]
+            contexts = self._passcode_context_query().filter(
+                ReservationPasscode.id.in_(passcode_uuids)
+            ).all() if passcode_uuids else []
+
+            messages = {}
+            skipped = []
+            for reservation_passcode, reservation, property_obj, user in contexts:
+                phone_number = self.format_phone_number(user.phone)
+                if not phone_number:
+                    skipped.append(str(reservation_passcode.id))
+                    continue
+
+                message = self._format_passcode_ready_message(reservation_passcode, reservation, property_obj)
+                messages[reservation_passcode.id] = (phone_number, message)
+
+            # Waiting on SMS futures from inside the SMS pool could take every worker
+            # and deadlock it, so a queued call sends one by one on its own thread
+            if _on_sms_executor():
+                outcomes = ((passcode_id, self._try_send_sms(*sms)) for passcode_id, sms in messages.items())
+            else:
+                futures = {
+                    _sms_executor.submit(self._try_send_sms, *sms): passcode_id
+                    for passcode_id, sms in messages.items()
+                }
+                outcomes = ((futures[future], future.result()) for future in as_completed(futures))
+
+            sent_ids = []
+            failed = []
+            for passcode_id, sms_result in outcomes:
+                if sms_result.get('success'):
+                    sent_ids.append(passcode_id)
+                else:
+                    failed.append({'id': str(passcode_id), 'error': sms_result.get('error')})
+
+            if sent_ids:
+                db.session.execute(
+                    update(ReservationPasscode)
+                    .where(ReservationPasscode.id.in_(sent_ids))
+                    .values(host_notified_at=datetime.now(timezone.utc))
+                )
                 db.session.commit()
 
-                logger.info(f"Sent passcode ready notification for reservation {reservation.id} to {phone_number}")
+            logger.info("Sent %d passcode ready notifications (%d failed, %d without phone)", len(sent_ids), len(failed), len(skipped))
 
-                return {
-                    'success': True,
-                    'message': 'Passcode ready notification sent successfully',
-                    'sms_sid': sms_result.get('sid')
-                }
-            else:
-                return {
-                    'success': False,
-                    'error': f"Failed to send SMS: {sms_result.get('error')}"
-                }
+            return {
+                'success': True,
+                'sent': [str(passcode_id) for passcode_id in sent_ids],
+                'failed': failed,
+                'skipped': skipped
+            }
 
         except Exception as e:
-            logger.error(f"Failed to send passcode ready notification: {str(e)}")
+            logger.error("Failed to send bulk passcode ready notifications: %s", e)
             db.session.rollback()
             return {'success': False, 'error': str(e)}
 
+    def _try_send_sms(self, phone_number: str, message: str) -> Dict:
+        """send_sms() that reports an exception as a failed result"""
+        try:
+            return send_sms(phone_number, message)
+        except Exception as e:
+            return {'success': False, 'error': str(e)}
+
     def get_notification_history(self, user_id: str, limit: int = 10) -> list:
         """
         Get notification history for a user's properties
         """
         try:
-            # Get user's properties
-            properties = Property.query.filter_by(user_id=user_id).all()
-            property_ids = [str(prop.id) for prop in properties]
-
-            # Get recent passcode records with notifications
-            recent_passcodes = ReservationPasscode.query.filter(
-                ReservationPasscode.property_id.in_(property_ids),
+            # Recent passcode records with notifications, projecting only the columns
+            # the history needs instead of materializing three ORM objects per row
+            rows = db.session.query(
+                ReservationPasscode.id,
+                ReservationPasscode.passcode,
+                ReservationPasscode.status,
+                ReservationPasscode.generation_method,
+                ReservationPasscode.host_notified_at,
+                Reservation.id.label('reservation_id'),
+                Reservation.guest_name_partial,
+                Property.name.label('property_name')
+            ).join(
+                Reservation, Reservation.id == ReservationPasscode.reservation_id
+            ).join(
+                Property, Property.id == ReservationPasscode.property_id
+            ).filter(
+                Property.user_id == user_id,
                 ReservationPasscode.host_notified_at.isnot(None)
             ).order_by(
                 ReservationPasscode.host_notified_at.desc()
             ).limit(limit).all()
 
-            notifications = []
-            for passcode_entry in recent_passcodes:
-                reservation = Reservation.query.get(passcode_entry.reservation_id)
-                property_obj = Property.query.get(passcode_entry.property_id)
-
-                if reservation and property_obj:
-                    notifications.append({
-                        'id': str(passcode_entry.id),
-                        'reservation_id': str(reservation.id),
-                        'property_name': property_obj.name,
-                        'guest_name': f"{reservation.first_name} {reservation.last_name}",
-                        'notification_type': passcode_entry.generation_method,
-                        'sent_at': passcode_entry.host_notified_at.isoformat(),
-                        'passcode': passcode_entry.passcode,
-                        'status': passcode_entry.status
-                    })
+            notifications = [
+                {
+                    'id': str(row.id),
+                    'reservation_id': str(row.reservation_id),
+                    'property_name': row.property_name,
+                    'guest_name': row.guest_name_partial,
+                    'notification_type': row.generation_method,
+                    'sent_at': row.host_notified_at.isoformat(),
+                    'passcode': row.passcode,
+                    'status': row.status
+                }
+                for row in rows
+            ]
 
             return notifications
 
         except Exception as e:
-            logger.error(f"Failed to get notification history: {str(e)}")
+            logger.error("Failed to get notification history: %s", e)
             return []
 
 # Global service instance
@@ -2,21 +2,97 @@
 Passcode generation service for reservation smart lock integration
 """
 
+import copy
 import logging
+import threading
+import uuid
+from cachetools import TTLCache
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone, timedelta
 from typing import Dict, Optional, List, Tuple
+from flask import g, has_app_context
+from sqlalchemy import event
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
 from ..models import Reservation, Property, SmartLock, ReservationPasscode, User, db
-from .ttlock_service import ttlock_service
-from ..utils.database import get_user_by_id
+from .ttlock_service import get_ttlock_service, to_ttlock_ms
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
+# Upper bound on simultaneous TTLock API calls for one reservation
+TTLOCK_MAX_CONCURRENT_CALLS = 8
+
+# Passcodes are generated this long before check-in
+PASSCODE_GENERATION_LEAD_TIME = timedelta(hours=3)
+
+# Short-lived process-wide config cache under the per-context one. The TTL bounds how
+# long the worker processes can keep serving a config after the web app changed it.
+_lock_config_ttl_cache = TTLCache(maxsize=1024, ttl=60)
+_lock_config_ttl_lock = threading.Lock()
+
+# Serialized passcodes keyed on the columns every write touches. The reservation and
+# property names in the payload are not part of the key, so the TTL bounds how long
+# a rename can take to show up.
+_passcode_dict_ttl_cache = TTLCache(maxsize=4096, ttl=30)
+_passcode_dict_ttl_lock = threading.Lock()
+
+def _serialize_reservation_passcode(reservation_passcode: ReservationPasscode) -> Dict:
+    """reservation_passcode.to_dict(), reused while the row is unchanged"""
+    key = (reservation_passcode.id, reservation_passcode.updated_at, reservation_passcode.host_notified_at)
+    with _passcode_dict_ttl_lock:
+        cached = _passcode_dict_ttl_cache.get(key)
+    if cached is None:
+        cached = copy.deepcopy(reservation_passcode.to_dict())
+        with _passcode_dict_ttl_lock:
+            _passcode_dict_ttl_cache[key] = cached
+    # Deep copy so a caller can't change the cached entry, including the nested
+    # ttlock_access_codes
+    return copy.deepcopy(cached)
+
+def _get_lock_config_cache() -> Optional[Dict]:
+    """Per app-context cache of property smart lock configs keyed by property id"""
+    if not has_app_context():
+        return None
+    if 'lock_configs' not in g:
+        g.lock_configs = {}
+    return g.lock_configs
+
+def invalidate_property_config(property_id=None):
+    """Forget the cached smart lock config for a property, or for every property"""
+    with _lock_config_ttl_lock:
+        if property_id is None:
+            _lock_config_ttl_cache.clear()
+        else:
+            _lock_config_ttl_cache.pop(str(property_id), None)
+
+    if has_app_context() and 'lock_configs' in g:
+        if property_id is None:
+            g.lock_configs.clear()
+        else:
+            g.lock_configs.pop(str(property_id), None)
+
+@event.listens_for(Property, 'after_update')
+def _invalidate_property_lock_config(mapper, connection, target):
+    """Drop the cached config when a property's lock settings change"""
+    invalidate_property_config(target.id)
+
+@event.listens_for(SmartLock, 'after_insert')
+@event.listens_for(SmartLock, 'after_update')
+@event.listens_for(SmartLock, 'after_delete')
+def _invalidate_smart_lock_config(mapper, connection, target):
+    """Drop the cached config when a lock is assigned, changed or removed"""
+    # The lock may have moved between properties, so clear rather than pop
+    invalidate_property_config()
+
 class PasscodeService:
     """Service for generating and managing reservation passcodes"""
 
-    def __init__(self):
-        self.ttlock_service = ttlock_service
+    @property
+    def ttlock_service(self):
+        """TTLock service for the current request or job, carrying its owner's token"""
+        return get_ttlock_service()
 
     def calculate_passcode_validity(self, check_in: datetime, check_out: datetime) -> Tuple[datetime, datetime]:
         """
@@ -28,47 +104,81 @@ class PasscodeService:
         valid_until = check_out + timedelta(hours=1)
         return valid_from, valid_until
 
-    def should_generate_passcode(self, reservation: Reservation) -> bool:
+    def should_generate_passcode(self, reservation: Reservation, now: Optional[datetime] = None) -> bool:
         """
         Check if we should generate a passcode for this reservation
         Generate 2-3 hours before check-in
+        Sweeps pass a shared `now` so the clock is read once per run.
         """
         if not reservation.check_in:
             return False
 
-        now = datetime.now(timezone.utc)
-        # Generate 3 hours before check-in
-        generation_time = reservation.check_in - timedelta(hours=3)
-
-        return now >= generation_time
+        now = now or datetime.now(timezone.utc)
+        return now >= reservation.check_in - PASSCODE_GENERATION_LEAD_TIME
 
     def get_property_smart_lock_config(self, property_id: str) -> Dict:
-        """Get smart lock configuration for a property"""
-        try:
-            property_obj = Property.query.get(property_id)
-            if not property_obj:
+        """
+        Get smart lock configuration for a property.
+        Memoized on g for the current request/batch and for a short TTL process-wide.
+        """
+        cache = _get_lock_config_cache()
+        cache_key = str(property_id)
+        if cache is not None and cache_key in cache:
+            return cache[cache_key]
+
+        with _lock_config_ttl_lock:
+            shared_config = _lock_config_ttl_cache.get(cache_key)
+
+        if shared_config is not None:
+            # Deep copy so callers can never mutate the shared entry
+            config = copy.deepcopy(shared_config)
+        else:
+            try:
+                config = self._load_property_smart_lock_config(property_id)
+            except Exception as e:
+                # Don't cache failures
+                logger.error(f"Failed to get property smart lock config: {str(e)}")
                 return {'type': 'traditional', 'locks': []}
 
-            # Get assigned smart locks for this property
-            smart_locks = SmartLock.query.filter_by(
-                property_id=property_id,
-                status='active'
-            ).all()
+            with _lock_config_ttl_lock:
+                _lock_config_ttl_cache[cache_key] = copy.deepcopy(config)
 
-            return {
-                'type': property_obj.smart_lock_type,
-                'instructions': property_obj.smart_lock_instructions,
-                'settings': property_obj.smart_lock_settings or {},
-                'locks': [lock.to_dict() for lock in smart_locks]
-            }
+        if cache is not None:
+            cache[cache_key] = config
+        return config
 
-        except Exception as e:
-            logger.error(f"Failed to get property smart lock config: {str(e)}")
+    def _load_property_smart_lock_config(self, property_id: str) -> Dict:
+        """Load smart lock configuration for a property from the database"""
+        property_obj = Property.query.get(property_id)
+        if not property_obj:
             return {'type': 'traditional', 'locks': []}
 
-    def generate_ttlock_passcode(self, reservation: Reservation, smart_locks: List[SmartLock]) -> Dict:
+        # Get assigned smart locks for this property
+        smart_locks = SmartLock.query.filter_by(
+            property_id=property_id,
+            status='active'
+        ).all()
+
+        return {
+            'type': property_obj.smart_lock_type,
+            'instructions': property_obj.smart_lock_instructions,
+            'settings': property_obj.smart_lock_settings or {},
+            'locks': [lock.to_dict() for lock in smart_locks]
+        }
+
+    def _get_property_owner(self, property_id) -> Optional[User]:
+        """Load a property's owner in one joined query"""
+        return User.query.join(
+            Property, Property.user_id == User.id
+        ).filter(
+            Property.id == property_id
+        ).first()
+
+    def generate_ttlock_passcode(self, reservation: Reservation, smart_locks: List[SmartLock],
+                                 notify_host: bool = True) -> Dict:
         """
-        Generate TTLock passcode for multiple locks (same passcode for all)
+        Generate TTLock passcode for multiple locks (same passcode for all).
+        notify_host=False skips the passcode ready SMS, for callers that send it in bulk.
         """
         try:
             if not smart_locks:
@@ -80,15 +190,11 @@ class PasscodeService:
             )
 
             # Convert to TTLock timestamp format (milliseconds)
-            start_timestamp = int(valid_from.timestamp() * 1000)
-            end_timestamp = int(valid_until.timestamp() * 1000)
+            start_timestamp = to_ttlock_ms(valid_from)
+            end_timestamp = to_ttlock_ms(valid_until)
 
             # Get property owner for TTLock authentication
-            property_obj = Property.query.get(reservation.property_id)
-            if not property_obj:
-                return {'success': False, 'error': 'Property not found'}
-
-            user = get_user_by_id(property_obj.user_id)
+            user = self._get_property_owner(reservation.property_id)
             if not user:
                 return {'success': False, 'error': 'Property owner not found'}
 
@@ -120,26 +226,32 @@ class PasscodeService:
             # For now, we'll generate individual passcodes for each lock
             # In production, you might need to use a different approach
 
-            lock_passcodes = []
-            for lock in smart_locks:
-                if lock.id == primary_lock.id:
-                    # Use the already generated passcode
-                    lock_passcodes.append({
-                        'lock_id': lock.id,
-                        'passcode': passcode,
-                        'ttlock_password_id': ttlock_password_id
-                    })
-                else:
-                    # Generate passcode for additional locks
-                    additional_result = self.ttlock_service.generate_random_passcode(
-                        lock_id=lock.ttlock_id,
-                        start_date=start_timestamp,
-                        end_date=end_timestamp
-                    )
-
+            # The primary lock already has its passcode
+            lock_passcodes = [{
+                'lock_id': str(primary_lock.id),
+                'passcode': passcode,
+                'ttlock_password_id': ttlock_password_id
+            }]
+
+            # Most properties have a single lock, in which case we're done. Otherwise each
+            # additional lock needs its own TTLock call; the token is already valid after
+            # the primary call, so run them concurrently rather than back to back.
+            additional_locks = smart_locks[1:]
+            if additional_locks:
+                ttlock = self.ttlock_service
+                access_token = ttlock.access_token
+                with ThreadPoolExecutor(max_workers=min(TTLOCK_MAX_CONCURRENT_CALLS, len(additional_locks))) as executor:
+                    additional_results = list(executor.map(
+                        lambda lock: ttlock.request_random_passcode(
+                            lock.ttlock_id, start_timestamp, end_timestamp, access_token
+                        ),
+                        additional_locks
+                    ))
+
+                for lock, additional_result in zip(additional_locks, additional_results):
                     if additional_result.get('success'):
                         lock_passcodes.append({
-                            'lock_id': lock.id,
+                            'lock_id': str(lock.id),
                             'passcode': additional_result.get('passcode'),
                             'ttlock_password_id': additional_result.get('keyboardPwdId')
                         })
@@ -157,21 +269,32 @@ class PasscodeService:
                 status='active',
                 ttlock_access_codes={
                     'lock_passcodes': lock_passcodes,
-                    'primary_lock_id': primary_lock.id
+                    'primary_lock_id': str(primary_lock.id)
                 }
             )
 
             db.session.add(reservation_passcode)
-            db.session.commit()
+            try:
+                db.session.commit()
+            except Exception as commit_error:
+                # The codes already exist on the locks; remove them so a failed write
+                # doesn't leave working passcodes nobody knows about
+                db.session.rollback()
+                self._delete_ttlock_passcodes(smart_locks, lock_passcodes)
+                if isinstance(commit_error, IntegrityError):
+                    # Another run created the passcode for this reservation first
+                    return self._existing_passcode_error(reservation.id)
+                raise
 
             logger.info(f"Generated TTLock passcode for reservation {reservation.id}: {passcode}")
 
             # Send notification to host about successful passcode generation
-            try:
-                from .notification_service import notification_service
-                notification_service.send_passcode_ready_notification(str(reservation_passcode.id))
-            except Exception as notify_error:
-                logger.warning(f"Failed to send passcode ready notification: {str(notify_error)}")
+            if notify_host:
+                try:
+                    from .notification_service import notification_service
+                    notification_service.enqueue('send_passcode_ready_notification', str(reservation_passcode.id))
+                except Exception as notify_error:
+                    logger.warning(f"Failed to queue passcode ready notification: {str(notify_error)}")
 
             return {
                 'success': True,
@@ -189,12 +312,32 @@ class PasscodeService:
             # Send failure notification to host
             try:
                 from .notification_service import notification_service
-                notification_service.send_ttlock_failure_notification(str(reservation.id), str(e))
+                notification_service.enqueue('send_ttlock_failure_notification', str(reservation.id), str(e))
             except Exception as notify_error:
-                logger.warning(f"Failed to send TTLock failure notification: {str(notify_error)}")
+                logger.warning(f"Failed to queue TTLock failure notification: {str(notify_error)}")
 
             return {'success': False, 'error': str(e)}
 
+    def _existing_passcode_error(self, reservation_id) -> Dict:
+        """Result for a generation attempt that lost to an existing passcode row"""
+        existing_passcode_id = db.session.query(ReservationPasscode.id).filter_by(
+            reservation_id=reservation_id
+        ).scalar()
+        return {
+            'success': False,
+            'error': 'Passcode already exists for this reservation',
+            'existing_passcode_id': str(existing_passcode_id) if existing_passcode_id else None
+        }
+
+    def _delete_ttlock_passcodes(self, smart_locks: List[SmartLock], lock_passcodes: List[Dict]):
+        """Best-effort removal of passcodes that were created on TTLock but never recorded"""
+        ttlock_ids = {str(lock.id): lock.ttlock_id for lock in smart_locks}
+        for lock_data in lock_passcodes:
+            ttlock_id = ttlock_ids.get(lock_data['lock_id'])
+            if ttlock_id and lock_data.get('ttlock_password_id'):
+                if not self.ttlock_service.delete_passcode(ttlock_id, lock_data['ttlock_password_id']):
+                    logger.error(f"Failed to remove orphaned TTLock passcode {lock_data['ttlock_password_id']} from lock {ttlock_id}")
+
     def create_manual_passcode_entry(self, reservation: Reservation) -> Dict:
         """
         Create manual passcode entry for properties with manual smart locks
@@ -205,34 +348,40 @@ class PasscodeService:
                 reservation.check_in, reservation.check_out
             )
 
-            # Create ReservationPasscode record with null passcode (manual entry pending)
-            reservation_passcode = ReservationPasscode(
-                reservation_id=reservation.id,
-                property_id=reservation.property_id,
-                passcode=None,  # Will be entered manually by host
-                valid_from=valid_from,
-                valid_until=valid_until,
-                generation_method='manual',
-                status='pending'  # Waiting for host to enter passcode
-            )
-
-            db.session.add(reservation_passcode)
+            # Create ReservationPasscode record with null passcode (manual entry pending).
+            # The unique reservation_id makes a concurrent duplicate a no-op instead of a second row.
+            reservation_passcode_id = db.session.execute(
+                insert(ReservationPasscode).values(
+                    reservation_id=reservation.id,
+                    property_id=reservation.property_id,
+                    passcode=None,  # Will be entered manually by host
+                    valid_from=valid_from,
+                    valid_until=valid_until,
+                    generation_method='manual',
+                    status='pending'  # Waiting for host to enter passcode
+                ).on_conflict_do_nothing(
+                    index_elements=['reservation_id']
+                ).returning(ReservationPasscode.id)
+            ).scalar()
             db.session.commit()
 
+            if reservation_passcode_id is None:
+                return self._existing_passcode_error(reservation.id)
+
             logger.info(f"Created manual passcode entry for reservation {reservation.id}")
 
             # Send notification to host requesting manual passcode entry
             try:
                 from .notification_service import notification_service
-                notification_service.send_manual_passcode_notification(str(reservation_passcode.id))
+                notification_service.enqueue('send_manual_passcode_notification', str(reservation_passcode_id))
             except Exception as notify_error:
-                logger.warning(f"Failed to send manual passcode notification: {str(notify_error)}")
+                logger.warning(f"Failed to queue manual passcode notification: {str(notify_error)}")
 
             return {
                 'success': True,
                 'valid_from': valid_from.isoformat(),
                 'valid_until': valid_until.isoformat(),
-                'reservation_passcode_id': str(reservation_passcode.id),
+                'reservation_passcode_id': str(reservation_passcode_id),
                 'requires_manual_entry': True
             }
 
@@ -241,33 +390,35 @@ class PasscodeService:
             db.session.rollback()
             return {'success': False, 'error': str(e)}
 
-    def generate_reservation_passcode(self, reservation_id: str) -> Dict:
+    def generate_reservation_passcode(self, reservation_id: str, notify_host: bool = True) -> Dict:
         """
-        Main method to generate passcode for a reservation based on property configuration
+        Main method to generate passcode for a reservation based on property configuration.
+        notify_host=False leaves the TTLock passcode ready SMS to the caller.
         """
         try:
             reservation = Reservation.query.get(reservation_id)
             if not reservation:
                 return {'success': False, 'error': 'Reservation not found'}
 
-            # Check if passcode already exists
-            existing_passcode = ReservationPasscode.query.filter_by(
-                reservation_id=reservation_id
-            ).first()
-
-            if existing_passcode:
-                return {
-                    'success': False,
-                    'error': 'Passcode already exists for this reservation',
-                    'existing_passcode_id': str(existing_passcode.id)
-                }
-
             # Get property smart lock configuration
             lock_config = self.get_property_smart_lock_config(reservation.property_id)
 
             if lock_config['type'] == 'ttlock':
-                # Generate TTLock passcode
-                smart_locks = [SmartLock(**lock_data) for lock_data in lock_config['locks']]
+                # Check before calling TTLock: a duplicate caught only at insert time
+                # would have created codes on the locks that then need deleting.
+                # The manual path relies on the unique reservation_id instead.
+                existing_passcode_id = db.session.query(ReservationPasscode.id).filter_by(
+                    reservation_id=reservation_id
+                ).scalar()
+
+                if existing_passcode_id:
+                    return {
+                        'success': False,
+                        'error': 'Passcode already exists for this reservation',
+                        'existing_passcode_id': str(existing_passcode_id)
+                    }
+
+                # Generate TTLock passcode against the live lock rows (the config may be cached)
                 smart_lock_objects = SmartLock.query.filter_by(
                     property_id=reservation.property_id,
                     status='active'
@@ -279,7 +430,7 @@ class PasscodeService:
                         'error': 'No active TTLock smart locks found for this property'
                     }
 
-                return self.generate_ttlock_passcode(reservation, smart_lock_objects)
+                return self.generate_ttlock_passcode(reservation, smart_lock_objects, notify_host=notify_host)
 
             elif lock_config['type'] == 'manual':
                 # Create manual passcode entry
@@ -333,14 +484,21 @@ class PasscodeService:
         Get passcode information for a reservation
         """
         try:
-            reservation_passcode = ReservationPasscode.query.filter_by(
-                reservation_id=reservation_id
-            ).first()
-
-            if not reservation_passcode:
-                return None
-
-            return reservation_passcode.to_dict()
+            # Read-only: don't flush pending changes just to run this lookup
+            # to_dict() only needs the guest name and property name from the
+            # related rows, so load just those in the same query
+            with db.session.no_autoflush:
+                reservation_passcode = ReservationPasscode.query.options(
+                    joinedload(ReservationPasscode.reservation).load_only(Reservation.guest_name_partial),
+                    joinedload(ReservationPasscode.property).load_only(Property.name)
+                ).filter_by(
+                    reservation_id=reservation_id
+                ).first()
+
+                if not reservation_passcode:
+                    return None
+
+                return _serialize_reservation_passcode(reservation_passcode)
 
         except Exception as e:
             logger.error(f"Failed to get reservation passcode: {str(e)}")
@@ -358,36 +516,68 @@ class PasscodeService:
             if not reservation_passcode:
                 return {'success': False, 'error': 'No passcode found for this reservation'}
 
+            failed_deletions = []
+
             # If it's a TTLock passcode, delete from TTLock API
             if reservation_passcode.generation_method == 'ttlock' and reservation_passcode.ttlock_access_codes:
                 lock_passcodes = reservation_passcode.ttlock_access_codes.get('lock_passcodes', [])
 
                 # Get property owner for TTLock authentication
-                property_obj = Property.query.get(reservation_passcode.property_id)
-                if property_obj:
-                    user = get_user_by_id(property_obj.user_id)
-                    if user:
-                        self.ttlock_service.set_user_context(user)
-
-                        # Delete passcodes from TTLock API
-                        for lock_data in lock_passcodes:
-                            if lock_data.get('ttlock_password_id'):
-                                smart_lock = SmartLock.query.get(lock_data['lock_id'])
-                                if smart_lock:
-                                    self.ttlock_service.delete_passcode(
-                                        smart_lock.ttlock_id,
-                                        lock_data['ttlock_password_id']
-                                    )
-
-            # Update status to revoked
+                user = self._get_property_owner(reservation_passcode.property_id)
+                if user:
+                    self.ttlock_service.set_user_context(user)
+
+                    # Load every lock we need to delete from in one query. The JSON holds
+                    # the ids as strings; bind them as UUIDs to match the column type.
+                    lock_ids = [
+                        uuid.UUID(str(lock_data['lock_id'])) for lock_data in lock_passcodes
+                        if lock_data.get('ttlock_password_id')
+                    ]
+                    locks_by_id = {
+                        str(lock.id): lock
+                        for lock in SmartLock.query.filter(SmartLock.id.in_(lock_ids)).all()
+                    } if lock_ids else {}
+
+                    deletions = []
+                    for lock_data in lock_passcodes:
+                        if lock_data.get('ttlock_password_id'):
+                            smart_lock = locks_by_id.get(str(lock_data['lock_id']))
+                            if smart_lock:
+                                deletions.append((smart_lock.ttlock_id, lock_data['ttlock_password_id']))
+
+                    # Authenticate once up front so every delete uses this owner's token,
+                    # then delete from TTLock API concurrently (a rejected token is
+                    # renewed on this thread, not in the workers)
+                    ttlock = self.ttlock_service
+                    if deletions and not ttlock.ensure_authenticated():
+                        logger.warning(f"TTLock authentication failed while revoking passcode for reservation {reservation_id}")
+                        failed_deletions = [password_id for _, password_id in deletions]
+                    elif deletions:
+                        deleted = ttlock.map_concurrently(
+                            lambda deletion: ttlock.delete_passcode(*deletion),
+                            deletions,
+                            max_workers=TTLOCK_MAX_CONCURRENT_CALLS
+                        )
+                        failed_deletions = [
+                            password_id for (_, password_id), ok in zip(deletions, deleted) if not ok
+                        ]
+
+            # Update status to revoked even if some TTLock deletions failed
             reservation_passcode.status = 'revoked'
             reservation_passcode.updated_at = datetime.now(timezone.utc)
 
             db.session.commit()
 
-            logger.info(f"Revoked passcode for reservation {reservation_id}")
+            if failed_deletions:
+                logger.warning(f"Revoked passcode for reservation {reservation_id}, but {len(failed_deletions)} TTLock deletion(s) failed")
+            else:
+                logger.info(f"Revoked passcode for reservation {reservation_id}")
 
-            return {'success': True, 'message': 'Passcode revoked successfully'}
+            return {
+                'success': True,
+                'message': 'Passcode revoked successfully',
+                'failed_deletions': failed_deletions
+            }
 
         except Exception as e:
             logger.error(f"Failed to revoke reservation passcode: {str(e)}")
@@ -399,34 +589,42 @@ class PasscodeService:
         Get all pending manual passcode entries for a user's properties
         """
         try:
-            # Get user's properties
-            properties = Property.query.filter_by(user_id=user_id).all()
-            property_ids = [str(prop.id) for prop in properties]
-
-            # Get pending manual passcodes
-            pending_passcodes = ReservationPasscode.query.filter(
-                ReservationPasscode.property_id.in_(property_ids),
-                ReservationPasscode.generation_method == 'manual',
-                ReservationPasscode.status == 'pending'
-            ).all()
-
-            result = []
-            for passcode_entry in pending_passcodes:
-                reservation = Reservation.query.get(passcode_entry.reservation_id)
-                property_obj = Property.query.get(passcode_entry.property_id)
-
-                if reservation and property_obj:
-                    result.append({
-                        'id': str(passcode_entry.id),
-                        'reservation_id': str(reservation.id),
-                        'property_name': property_obj.name,
-                        'guest_name': f"{reservation.first_name} {reservation.last_name}",
-                        'check_in': passcode_entry.valid_from.isoformat(),
-                        'check_out': passcode_entry.valid_until.isoformat(),
-                        'created_at': passcode_entry.created_at.isoformat()
-                    })
-
-            return result
+            # Pending manual passcodes with their reservation and property in one joined
+            # query; the join on Property also scopes the result to the user.
+            # Only the rendered fields are selected, and since this is read-only
+            # pending changes are not flushed first.
+            with db.session.no_autoflush:
+                rows = db.session.query(
+                    ReservationPasscode.id,
+                    ReservationPasscode.reservation_id,
+                    ReservationPasscode.valid_from,
+                    ReservationPasscode.valid_until,
+                    ReservationPasscode.created_at,
+                    Reservation.guest_name_partial,
+                    Property.name.label('property_name')
+                ).join(
+                    Reservation, Reservation.id == ReservationPasscode.reservation_id
+                ).join(
+                    Property, Property.id == ReservationPasscode.property_id
+                ).filter(
+                    Property.user_id == user_id,
+                    ReservationPasscode.generation_method == 'manual',
+                    ReservationPasscode.status == 'pending'
+                ).all()
+
+            # Plain result rows, not ORM instances: nothing enters the identity map
+            return [
+                {
+                    'id': str(row.id),
+                    'reservation_id': str(row.reservation_id),
+                    'property_name': row.property_name,
+                    'guest_name': row.guest_name_partial,
+                    'check_in': row.valid_from.isoformat(),
+                    'check_out': row.valid_until.isoformat(),
+                    'created_at': row.created_at.isoformat()
+                }
+                for row in rows
+            ]
 
         except Exception as e:
             logger.error(f"Failed to get pending manual passcodes: {str(e)}")
@@ -4,20 +4,120 @@ TTLock API Service for smart lock integration using passcodes
 
 import os
 import requests
-import hashlib
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import time
 import logging
-import random
-import string
+import threading
+from cachetools import TTLCache
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone, timedelta
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional
+from flask import current_app, g, has_app_context
+from sqlalchemy import event
+from sqlalchemy.dialects.postgresql import insert
 from ..models import SmartLock, AccessCode, AccessLog, db
+from ..utils.encryption import ttlock_password_md5
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
+# Access log action for TTLock record methods 1-6 (index = method - 1):
+# password, key, card, fingerprint and app unlocks, then a failed attempt
+_TTLOCK_UNLOCK_ACTIONS = ('unlock', 'unlock', 'unlock', 'unlock', 'unlock', 'failed_attempt')
+
+def _record_action(unlock_method) -> str:
+    """Map a TTLock record method to our action; unknown methods count as unlocks"""
+    if isinstance(unlock_method, int) and 1 <= unlock_method <= 6:
+        return _TTLOCK_UNLOCK_ACTIONS[unlock_method - 1]
+    return 'unlock'
+
+# Webhook records are written here so the endpoint can answer TTLock immediately.
+# The queue is in memory (lost on restart), so it is capped; past the cap the
+# endpoint processes records inline.
+_webhook_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='ttlock-webhook')
+TTLOCK_WEBHOOK_MAX_PENDING = int(os.getenv('TTLOCK_WEBHOOK_MAX_PENDING', '100'))
+_webhook_slots = threading.BoundedSemaphore(TTLOCK_WEBHOOK_MAX_PENDING)
+
+# ttlock_id -> (smart lock id, lock name) for webhook lookups. Plain values rather
+# than SmartLock instances, which belong to the session that loaded them.
+_webhook_lock_cache = TTLCache(maxsize=512, ttl=300)
+_webhook_lock_cache_lock = threading.Lock()
+
+def _get_webhook_lock(ttlock_id: str):
+    """(id, lock_name) of the lock with this TTLock id, or None if we don't know it"""
+    with _webhook_lock_cache_lock:
+        cached = _webhook_lock_cache.get(ttlock_id)
+    if cached is not None:
+        return cached
+
+    row = db.session.query(SmartLock.id, SmartLock.lock_name).filter_by(ttlock_id=ttlock_id).first()
+    if row is None:
+        # Not cached: the lock may be connected at any moment
+        return None
+
+    cached = (row.id, row.lock_name)
+    with _webhook_lock_cache_lock:
+        _webhook_lock_cache[ttlock_id] = cached
+    return cached
+
+@event.listens_for(SmartLock, 'after_update')
+@event.listens_for(SmartLock, 'after_delete')
+def _invalidate_webhook_lock_cache(mapper, connection, target):
+    """The ttlock_id itself may have changed, so clear rather than pop"""
+    with _webhook_lock_cache_lock:
+        _webhook_lock_cache.clear()
+
+# Concurrent TTLock calls when syncing many locks; stays under the session's pool size
+TTLOCK_SYNC_MAX_WORKERS = 10
+
+# TTLock errcode for an invalid or expired access token
+_TTLOCK_INVALID_TOKEN_ERRCODES = frozenset({10003})
+
+# Marks threads running a map_concurrently() task. They only report a rejected token:
+# renewing it writes the user row, which needs the caller's app context and session.
+_fan_out_state = threading.local()
+
+# Renew the access token this long before TTLock would reject it
+TTLOCK_TOKEN_REFRESH_MARGIN_SECONDS = 60
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_ONE_MS = timedelta(milliseconds=1)
+
+
+def to_ttlock_ms(dt: datetime) -> int:
+    """Convert a datetime to TTLock's millisecond timestamp using integer arithmetic"""
+    if dt.tzinfo is None:
+        # Same interpretation as datetime.timestamp(): naive means local time
+        dt = dt.astimezone()
+    return (dt - _EPOCH) // _ONE_MS
+
+def _create_http_session() -> requests.Session:
+    """
+    One pooled session so repeated calls reuse keep-alive connections to TTLock
+    instead of a fresh TCP + TLS handshake each time. Retry only applies to
+    idempotent methods by default, so POSTs that create passcodes are never replayed.
+    """
+    session = requests.Session()
+    session.mount('https://', HTTPAdapter(
+        pool_connections=10,
+        pool_maxsize=20,
+        max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 502, 503, 504])
+    ))
+    session.headers.update({'Content-Type': 'application/x-www-form-urlencoded'})
+    return session
+
+# Shared by every service instance; the per-user token lives on the instance
+_http_session = _create_http_session()
+
+if not all([os.getenv('TTLOCK_CLIENT_ID'), os.getenv('TTLOCK_CLIENT_SECRET')]):
+    logger.warning("TTLock credentials not configured. Set TTLOCK_CLIENT_ID and TTLOCK_CLIENT_SECRET environment variables.")
+
 class TTLockService:
-    """Service class for TTLock API integration using passcodes"""
+    """
+    Service class for TTLock API integration using passcodes.
+    Holds the user and token it acts for, so use get_ttlock_service() for a per-request instance.
+    """
 
     def __init__(self):
         self.base_url = "https://euapi.ttlock.com"  # Fixed: was euopen, should be euapi
@@ -25,38 +125,45 @@ class TTLockService:
         self.client_secret = os.getenv('TTLOCK_CLIENT_SECRET')
         self.access_token = None  # Will be obtained via OAuth
         self.current_user = None  # Will be set when needed
+        self.session = _http_session
 
-        if not all([self.client_id, self.client_secret]):
-            logger.warning("TTLock credentials not configured. Set TTLOCK_CLIENT_ID and TTLOCK_CLIENT_SECRET environment variables.")
-
-    def _make_request(self, endpoint: str, method: str = 'POST', params: Dict = None, data: Dict = None, need_auth: bool = True) -> Dict:
+    def _make_request(self, endpoint: str, method: str = 'POST', params: Dict = None, data: Dict = None,
+                      need_auth: bool = True, retry_on_invalid_token: bool = True) -> Dict:
         """Make authenticated request to TTLock API"""
         try:
             url = f"{self.base_url}{endpoint}"
-            headers = {
-                'Content-Type': 'application/x-www-form-urlencoded',
-            }
 
             # Add common params
             if params is None:
                 params = {}
 
             params['clientId'] = self.client_id
-            params['date'] = int(time.time() * 1000)  # Current timestamp in milliseconds
+            params['date'] = time.time_ns() // 1_000_000  # Current timestamp in milliseconds
 
             # Add access token for authenticated requests
             if need_auth and self.access_token:
                 params['accessToken'] = self.access_token
 
             if method == 'GET':
-                response = requests.get(url, params=params, headers=headers, timeout=30)
+                response = self.session.get(url, params=params, timeout=30)
             else:
-                response = requests.post(url, params=params, data=data, headers=headers, timeout=30)
+                response = self.session.post(url, params=params, data=data, timeout=30)
 
             response.raise_for_status()
             result = response.json()
 
-            if result.get('errcode', 0) != 0:
+            errcode = result.get('errcode', 0)
+            if errcode in _TTLOCK_INVALID_TOKEN_ERRCODES and need_auth:
+                if getattr(_fan_out_state, 'active', False):
+                    # Worker thread: map_concurrently renews on the calling thread and retries
+                    _fan_out_state.token_rejected = True
+                elif (retry_on_invalid_token and self.current_user and has_app_context()
+                        and self.ensure_authenticated(force_refresh=True)):
+                    # The token went stale; we renewed it, so retry this call once
+                    logger.info("TTLock rejected the access token, retrying with a renewed one")
+                    return self._make_request(endpoint, method, params, data, need_auth, retry_on_invalid_token=False)
+
+            if errcode != 0:
                 logger.error(f"TTLock API error: {result.get('errmsg', 'Unknown error')}")
                 raise Exception(f"TTLock API error: {result.get('errmsg', 'Unknown error')}")
 
@@ -69,15 +176,47 @@ class TTLockService:
             logger.error(f"TTLock API error: {str(e)}")
             raise
 
-    def authenticate_with_app_credentials(self, username: str, password: str) -> Dict:
+    def map_concurrently(self, fn, items, max_workers: int = TTLOCK_SYNC_MAX_WORKERS) -> List:
+        """
+        Call fn(item) for each item on worker threads and return the results in order.
+        Workers never renew the access token; if TTLock rejected it, it is renewed once
+        here on the calling thread and only the rejected items are run again.
+        """
+        items = list(items)
+        if not items:
+            return []
+
+        def call(item):
+            _fan_out_state.active = True
+            _fan_out_state.token_rejected = False
+            try:
+                return fn(item), _fan_out_state.token_rejected
+            finally:
+                _fan_out_state.active = False
+
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as executor:
+            outcomes = list(executor.map(call, items))
+
+        results = [result for result, _ in outcomes]
+        rejected = [index for index, (_, token_rejected) in enumerate(outcomes) if token_rejected]
+        if rejected and self.current_user and self.ensure_authenticated(force_refresh=True):
+            logger.info(f"TTLock rejected the access token, retrying {len(rejected)} call(s) with a renewed one")
+            with ThreadPoolExecutor(max_workers=min(max_workers, len(rejected))) as executor:
+                retried = list(executor.map(call, [items[index] for index in rejected]))
+            for index, (result, _) in zip(rejected, retried):
+                results[index] = result
+
+        return results
+
+    def authenticate_with_app_credentials(self, username: str, password: str, password_is_md5: bool = False) -> Dict:
         """
         Get access token using TTLock app credentials (OAuth flow)
         username: TTLock app username (phone number or email)
-        password: TTLock app password (will be MD5 hashed)
+        password: TTLock app password (will be MD5 hashed unless password_is_md5)
         """
         try:
-            # Create MD5 hash of password
-            password_hash = hashlib.md5(password.encode()).hexdigest()
+            # TTLock takes the MD5 of the password
+            password_hash = password if password_is_md5 else ttlock_password_md5(password)
 
             # For OAuth, we need to send data as form-encoded POST body
             data = {
@@ -89,11 +228,8 @@ class TTLockService:
 
             # Special OAuth request - different from regular API calls
             url = f"{self.base_url}/oauth2/token"
-            headers = {
-                'Content-Type': 'application/x-www-form-urlencoded',
-            }
 
-            response = requests.post(url, data=data, headers=headers, timeout=30)
+            response = self.session.post(url, data=data, timeout=30)
             response.raise_for_status()
             result = response.json()
 
@@ -123,36 +259,41 @@ class TTLockService:
             return {'success': False, 'error': str(e)}
 
     def set_access_token(self, access_token: str) -> bool:
-        """Set access token (for testing or when token is already available)"""
-        try:
-            self.access_token = access_token
+        """
+        Set access token (for testing or when token is already available).
+        Not checked here; a stale token is renewed when TTLock rejects it.
+        """
+        self.access_token = access_token
+        return True
 
-            # Test the token by trying to get locks
-            locks = self.get_locks()
-            if locks is not None:
-                logger.info("Successfully validated TTLock access token")
-                return True
-            else:
-                logger.error("Invalid TTLock access token")
-                self.access_token = None
-                return False
+    def validate_access_token(self, page_size: int = 20) -> Optional[List[Dict]]:
+        """Check the current token with a lock list call; returns the locks, or None if it was rejected"""
+        try:
+            response = self._make_request(
+                '/v3/lock/list', 'POST', params={'pageNo': 1, 'pageSize': page_size},
+                retry_on_invalid_token=False
+            )
+            logger.info("Successfully validated TTLock access token")
+            return response.get('list', [])
 
         except Exception as e:
             logger.error(f"TTLock token validation failed: {str(e)}")
-            self.access_token = None
-            return False
+            return None
 
     def refresh_access_token(self, refresh_token: str) -> Dict:
         """Refresh expired access token"""
         try:
-            params = {
+            # The token endpoint takes a form-encoded body, like the password grant
+            data = {
                 'clientId': self.client_id,
                 'clientSecret': self.client_secret,
                 'grant_type': 'refresh_token',
                 'refresh_token': refresh_token
             }
 
-            response = self._make_request('/oauth2/token', 'POST', params=params, need_auth=False)
+            response = self.session.post(f"{self.base_url}/oauth2/token", data=data, timeout=30)
+            response.raise_for_status()
+            response = response.json()
 
             if 'access_token' in response:
                 self.access_token = response['access_token']
@@ -260,11 +401,7 @@ class TTLockService:
         try:
             lock_detail = self.get_lock_detail(smart_lock.ttlock_id)
             if lock_detail:
-                # Update lock information
-                smart_lock.battery_level = lock_detail.get('electricQuantity')
-                smart_lock.lock_version = lock_detail.get('lockVersion')
-                smart_lock.status = 'active' if lock_detail.get('lockData') else 'offline'
-                smart_lock.updated_at = datetime.now(timezone.utc)
+                self._apply_lock_detail(smart_lock, lock_detail)
 
                 db.session.commit()
                 logger.info(f"Updated lock status for {smart_lock.lock_name}")
@@ -276,41 +413,94 @@ class TTLockService:
             logger.error(f"Failed to sync lock status: {str(e)}")
             return False
 
+    def sync_all_locks(self, smart_locks: List[SmartLock]) -> int:
+        """
+        Sync status for many locks. The TTLock calls run concurrently over the pooled
+        session; the updates are applied and committed once on the calling thread.
+        """
+        if not smart_locks:
+            return 0
+
+        try:
+            lock_details = self.map_concurrently(self.get_lock_detail, [lock.ttlock_id for lock in smart_locks])
+
+            synced = 0
+            for smart_lock, lock_detail in zip(smart_locks, lock_details):
+                if lock_detail:
+                    self._apply_lock_detail(smart_lock, lock_detail)
+                    synced += 1
+
+            if synced:
+                db.session.commit()
+                logger.info(f"Updated lock status for {synced} of {len(smart_locks)} locks")
+            return synced
+
+        except Exception as e:
+            logger.error(f"Failed to sync lock statuses: {str(e)}")
+            db.session.rollback()
+            return 0
+
+    def _apply_lock_detail(self, smart_lock: SmartLock, lock_detail: Dict):
+        """Copy lock information from a TTLock lock detail response"""
+        smart_lock.battery_level = lock_detail.get('electricQuantity')
+        smart_lock.lock_version = lock_detail.get('lockVersion')
+        smart_lock.status = 'active' if lock_detail.get('lockData') else 'offline'
+        smart_lock.updated_at = datetime.now(timezone.utc)
+
     def set_user_context(self, user):
         """Set the current user context for accessing stored credentials"""
         self.current_user = user
 
-    def ensure_authenticated(self):
-        """Ensure we have a valid access token, re-authenticate if needed"""
+    def ensure_authenticated(self, force_refresh: bool = False):
+        """
+        Ensure we have a valid access token, re-authenticate if needed.
+        force_refresh renews it even if the stored expiry says it's still good.
+        """
         if not self.current_user:
             logger.error("No user context set for TTLock authentication")
             return False
 
         # Check if current token is still valid
-        if self.current_user.is_ttlock_token_valid():
+        if not force_refresh and self.current_user.is_ttlock_token_valid(TTLOCK_TOKEN_REFRESH_MARGIN_SECONDS):
             self.access_token = self.current_user.ttlock_access_token
             return True
 
-        # Token expired or doesn't exist, try to re-authenticate
-        username, password = self.current_user.get_ttlock_credentials()
-        if not username or not password:
+        from ..models import db
+
+        # Token expired or about to: renew it with the refresh token when we have one
+        refresh_token = self.current_user.get_ttlock_refresh_token()
+        if refresh_token:
+            refresh_result = self.refresh_access_token(refresh_token)
+            if refresh_result.get('success'):
+                self.current_user.update_ttlock_token(
+                    access_token=refresh_result['access_token'],
+                    expires_in=refresh_result.get('expires_in'),
+                    refresh_token=refresh_result.get('refresh_token')
+                )
+                db.session.commit()
+                return True
+            logger.warning(f"TTLock token refresh failed, falling back to stored credentials: {refresh_result.get('error')}")
+
+        # No refresh token or refresh failed, try to re-authenticate
+        username, password_md5 = self.current_user.get_ttlock_credentials()
+        if not username or not password_md5:
             logger.error("No stored TTLock credentials found for user")
             return False
 
         # Re-authenticate with stored credentials
         logger.info("TTLock token expired, re-authenticating with stored credentials")
-        auth_result = self.authenticate_with_app_credentials(username, password)
+        auth_result = self.authenticate_with_app_credentials(username, password_md5, password_is_md5=True)
 
         if auth_result.get('success'):
             # Update stored token info
             self.current_user.update_ttlock_token(
                 access_token=auth_result['access_token'],
                 expires_in=auth_result.get('expires_in', 3600),  # Default 1 hour
-                uid=auth_result.get('uid')
+                uid=auth_result.get('uid'),
+                refresh_token=auth_result.get('refresh_token')
             )
 
             # Save to database
-            from ..models import db
             db.session.commit()
 
             self.access_token = auth_result['access_token']
@@ -330,32 +520,45 @@ class TTLockService:
                     'error': 'TTLock authentication failed. Please reconnect your TTLock account.'
                 }
 
+            return self.request_random_passcode(lock_id, start_date, end_date, self.access_token)
+
+        except Exception as e:
+            logger.error(f"Failed to generate random passcode: {str(e)}")
+            return {
+                'success': False,
+                'error': str(e)
+            }
+
+    def request_random_passcode(self, lock_id: str, start_date: int, end_date: int, access_token: str) -> Dict:
+        """
+        Call TTLock's keyboardPwd/get with an already valid access token.
+        Touches no user or database state, so it is safe to run from worker threads.
+        """
+        try:
             # Use form data instead of URL params
             data = {
                 'clientId': self.client_id,
-                'accessToken': self.access_token,
+                'accessToken': access_token,
                 'lockId': str(lock_id),  # Ensure it's a string
                 'keyboardPwdType': '3',  # Period type (temporary passcode) - as string
                 'keyboardPwdName': 'Test Code',
                 'startDate': str(start_date),  # Convert to string
                 'endDate': str(end_date),      # Convert to string
-                'date': str(int(time.time() * 1000))  # Convert to string
+                'date': str(time.time_ns() // 1_000_000)  # Convert to string
             }
 
-            # Debug logging
-            logger.info(f"Generating passcode for lock {lock_id} with data: {data}")
+            # Debug logging, with the access token redacted
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Generating passcode for lock %s with data: %s", lock_id, {**data, 'accessToken': '***'})
 
             # Make POST request with form data
             url = f"{self.base_url}/v3/keyboardPwd/get"
-            headers = {
-                'Content-Type': 'application/x-www-form-urlencoded'
-            }
+            response = self.session.post(url, data=data, timeout=30)
 
-            import requests
-            response = requests.post(url, data=data, headers=headers, timeout=30)
-
-            logger.info(f"TTLock API response status: {response.status_code}")
-            logger.info(f"TTLock API response body: {response.text}")
+            # The body carries the generated passcode, so keep it out of INFO logs
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("TTLock API response status: %s", response.status_code)
+                logger.debug("TTLock API response body: %s", response.text)
 
             if response.status_code == 200:
                 try:
@@ -400,13 +603,14 @@ class TTLockService:
                              is_one_time: bool = False) -> Optional[str]:
         """Create temporary random passcode for a guest reservation using TTLock API"""
         try:
-            smart_lock = SmartLock.query.get(smart_lock_id)
+            smart_lock = db.session.get(SmartLock, smart_lock_id)
             if not smart_lock:
                 raise Exception("Smart lock not found")
+            lock_name = smart_lock.lock_name
 
             # Convert datetime to TTLock timestamp format (milliseconds)
-            start_timestamp = int(check_in.timestamp() * 1000)
-            end_timestamp = int(check_out.timestamp() * 1000)
+            start_timestamp = to_ttlock_ms(check_in)
+            end_timestamp = to_ttlock_ms(check_out)
 
             # Generate random passcode via TTLock API (no custom passcode needed!)
             password_type = 3 if is_one_time else 2  # 3=one-time, 2=timed
@@ -437,11 +641,14 @@ class TTLockService:
                     status='active'
                 )
 
+                # Flush for the generated id, and read it before commit expires the instance
                 db.session.add(access_code)
+                db.session.flush()
+                access_code_id = access_code.id
                 db.session.commit()
 
-                logger.info(f"Created random passcode {generated_passcode} for guest {guest_name} on lock {smart_lock.lock_name}")
-                return str(access_code.id)
+                logger.info(f"Created random passcode {generated_passcode} for guest {guest_name} on lock {lock_name}")
+                return str(access_code_id)
             else:
                 logger.error(f"Failed to generate random passcode for guest {guest_name}: {passcode_response}")
                 return None
@@ -476,11 +683,38 @@ class TTLockService:
             logger.error(f"Failed to revoke guest passcode: {str(e)}")
             return False
 
+    def enqueue_webhook_record(self, webhook_data: Dict) -> bool:
+        """
+        Process a webhook record on the background executor and return immediately.
+        Returns False without queuing when TTLOCK_WEBHOOK_MAX_PENDING records are
+        already waiting, so the caller can process it inline instead.
+        """
+        if not _webhook_slots.acquire(blocking=False):
+            return False
+        app = current_app._get_current_object()
+        try:
+            _webhook_executor.submit(self._process_webhook_record_in_context, app, webhook_data)
+        except Exception:
+            _webhook_slots.release()
+            raise
+        return True
+
+    def _process_webhook_record_in_context(self, app, webhook_data: Dict):
+        with app.app_context():
+            try:
+                if not self.process_webhook_record(webhook_data):
+                    logger.warning("Failed to process queued webhook record")
+            except Exception as e:
+                logger.error(f"Queued webhook record raised: {str(e)}")
+            finally:
+                db.session.remove()
+                _webhook_slots.release()
+
     def process_webhook_record(self, webhook_data: Dict) -> bool:
         """Process unlock record received via webhook"""
         try:
-            # Log the webhook data for debugging
-            logger.info(f"Processing TTLock webhook: {webhook_data}")
+            # The raw payload carries the passcode used, so keep it out of INFO logs
+            logger.debug("Processing TTLock webhook: %s", webhook_data)
 
             lock_id = webhook_data.get('lockId')
             if not lock_id:
@@ -489,8 +723,8 @@ class TTLockService:
 
             # Try to find the smart lock
             try:
-                smart_lock = SmartLock.query.filter_by(ttlock_id=str(lock_id)).first()
-                if not smart_lock:
+                webhook_lock = _get_webhook_lock(str(lock_id))
+                if not webhook_lock:
                     logger.warning(f"Received webhook for unknown lock ID: {lock_id}")
                     # Return True anyway since webhook was received successfully
                     return True
@@ -499,66 +733,72 @@ class TTLockService:
                 # Return True since webhook was received, even if we can't process it
                 return True
 
+            smart_lock_id, lock_name = webhook_lock
+
             # Extract record information
+            records = webhook_data.get('records') or []
+            record = records[0] if records else {}
+
             record_time = datetime.fromtimestamp(
-                webhook_data.get('records', [{}])[0].get('lockDate', time.time() * 1000) / 1000,
+                record.get('lockDate', time.time() * 1000) / 1000,
                 tz=timezone.utc
-            ) if webhook_data.get('records') else datetime.now(timezone.utc)
-
-            # Check if this record already exists
-            existing_log = AccessLog.query.filter_by(
-                smart_lock_id=smart_lock.id,
-                timestamp=record_time
-            ).first()
-
-            if existing_log:
-                return True  # Already processed
+            ) if records else datetime.now(timezone.utc)
 
             # Map unlock method to action
-            unlock_method = webhook_data.get('records', [{}])[0].get('method', 0) if webhook_data.get('records') else 0
-            action_map = {
-                1: 'unlock',  # Password unlock
-                2: 'unlock',  # Key unlock
-                3: 'unlock',  # Card unlock
-                4: 'unlock',  # Fingerprint unlock
-                5: 'unlock',  # App unlock
-                6: 'failed_attempt'  # Failed attempt
-            }
-            action = action_map.get(unlock_method, 'unlock')
+            unlock_method = record.get('method', 0)
+            action = _record_action(unlock_method)
 
             # Try to find matching access code if it was a password unlock
             access_code_id = None
             if unlock_method == 1:  # Password unlock
-                password_used = webhook_data.get('records', [{}])[0].get('password')
+                password_used = record.get('password')
                 if password_used:
                     access_code = AccessCode.query.filter_by(
-                        smart_lock_id=smart_lock.id,
+                        smart_lock_id=smart_lock_id,
                         passcode=str(password_used),
                         status='active'
                     ).first()
 
                     if access_code:
                         access_code_id = access_code.id
-                        # Update usage count
-                        access_code.usage_count += 1
-
-                        # Check if it's one-time use or reached max usage
-                        if access_code.is_one_time or (access_code.max_usage and access_code.usage_count >= access_code.max_usage):
-                            access_code.status = 'expired'
-
-            # Create access log
-            access_log = AccessLog(
-                smart_lock_id=smart_lock.id,
-                access_code_id=access_code_id,
-                action=action,
-                timestamp=record_time,
-                user_info=webhook_data
-            )
 
-            db.session.add(access_log)
+            # Keep only the fields we read back; the raw payload is in the log line above
+            user_info = {
+                'method': record.get('method'),
+                'password': record.get('password'),
+                'lockDate': record.get('lockDate'),
+                'source': 'webhook',
+            }
+
+            # Create access log; a record we already have (redelivery, or a sync
+            # that got there first) hits the unique lock/timestamp and inserts nothing
+            inserted_id = db.session.execute(
+                insert(AccessLog).values(
+                    smart_lock_id=smart_lock_id,
+                    access_code_id=access_code_id,
+                    action=action,
+                    timestamp=record_time,
+                    user_info=user_info
+                ).on_conflict_do_nothing(
+                    index_elements=['smart_lock_id', 'timestamp']
+                ).returning(AccessLog.id)
+            ).scalar()
+
+            if inserted_id is None:
+                db.session.rollback()
+                return True  # Already processed
+
+            if access_code_id:
+                # Update usage count
+                access_code.usage_count += 1
+
+                # Check if it's one-time use or reached max usage
+                if access_code.is_one_time or (access_code.max_usage and access_code.usage_count >= access_code.max_usage):
+                    access_code.status = 'expired'
+
             db.session.commit()
 
-            logger.info(f"Processed webhook record for lock {smart_lock.lock_name}")
+            logger.info(f"Processed webhook record for lock {lock_name}")
             return True
 
         except Exception as e:
@@ -566,66 +806,102 @@ class TTLockService:
             db.session.rollback()
             return False
 
+    def _access_log_window(self, days_back: int):
+        """TTLock millisecond timestamps for the last days_back days"""
+        end_date = datetime.now(timezone.utc)
+        start_date = end_date - timedelta(days=days_back)
+        return to_ttlock_ms(start_date), to_ttlock_ms(end_date)
+
     def sync_access_logs(self, smart_lock: SmartLock, days_back: int = 7) -> int:
         """Sync access logs from TTLock API"""
-        try:
-            # Calculate date range
-            end_date = datetime.now(timezone.utc)
-            start_date = end_date - timedelta(days=days_back)
+        start_timestamp, end_timestamp = self._access_log_window(days_back)
 
-            start_timestamp = int(start_date.timestamp() * 1000)
-            end_timestamp = int(end_date.timestamp() * 1000)
+        # Get records from API
+        records = self.get_lock_records(
+            lock_id=smart_lock.ttlock_id,
+            start_date=start_timestamp,
+            end_date=end_timestamp
+        )
 
-            # Get records from API
-            records = self.get_lock_records(
-                lock_id=smart_lock.ttlock_id,
-                start_date=start_timestamp,
-                end_date=end_timestamp
-            )
+        return self._store_access_log_records(smart_lock, records)
 
-            logs_created = 0
-            for record in records:
-                # Check if log already exists
-                record_time = datetime.fromtimestamp(record.get('lockDate', 0) / 1000, tz=timezone.utc)
-
-                existing_log = AccessLog.query.filter_by(
-                    smart_lock_id=smart_lock.id,
-                    timestamp=record_time
-                ).first()
-
-                if not existing_log:
-                    # Map TTLock record type to our action
-                    unlock_method = record.get('method', 0)
-                    action_map = {
-                        1: 'unlock',  # Password
-                        2: 'unlock',  # Key
-                        3: 'unlock',  # Card
-                        4: 'unlock',  # Fingerprint
-                        5: 'unlock',  # App
-                        6: 'failed_attempt'
-                    }
-                    action = action_map.get(unlock_method, 'unlock')
-
-                    # Try to match access code for password unlocks
-                    access_code_id = None
-                    if unlock_method == 1 and record.get('password'):
-                        access_code = AccessCode.query.filter_by(
-                            smart_lock_id=smart_lock.id,
-                            passcode=str(record.get('password'))
-                        ).first()
-                        if access_code:
-                            access_code_id = access_code.id
-
-                    access_log = AccessLog(
-                        smart_lock_id=smart_lock.id,
-                        access_code_id=access_code_id,
-                        action=action,
-                        timestamp=record_time,
-                        user_info=record
-                    )
-
-                    db.session.add(access_log)
-                    logs_created += 1
+    def sync_all_access_logs(self, smart_locks: List[SmartLock], days_back: int = 7) -> int:
+        """
+        Sync access logs for many locks. Records are fetched concurrently and stored
+        on the calling thread, one lock at a time.
+        """
+        if not smart_locks:
+            return 0
+
+        start_timestamp, end_timestamp = self._access_log_window(days_back)
+        records_per_lock = self.map_concurrently(
+            lambda lock: self.get_lock_records(lock.ttlock_id, start_timestamp, end_timestamp),
+            smart_locks
+        )
+
+        return sum(
+            self._store_access_log_records(smart_lock, records)
+            for smart_lock, records in zip(smart_locks, records_per_lock)
+        )
+
+    def _store_access_log_records(self, smart_lock: SmartLock, records: List[Dict]) -> int:
+        """Store TTLock records that aren't logged yet; returns how many were added"""
+        try:
+            if not records:
+                return 0
+
+            record_times = [
+                datetime.fromtimestamp(record.get('lockDate', 0) / 1000, tz=timezone.utc)
+                for record in records
+            ]
+
+            # Access codes for every password unlock in the batch, in one query
+            passwords = {
+                str(record.get('password')) for record in records
+                if record.get('method', 0) == 1 and record.get('password')
+            }
+            access_code_ids = {
+                passcode: access_code_id
+                for access_code_id, passcode in db.session.query(AccessCode.id, AccessCode.passcode).filter(
+                    AccessCode.smart_lock_id == smart_lock.id,
+                    AccessCode.passcode.in_(passwords)
+                ).all()
+            } if passwords else {}
+
+            new_logs = []
+            seen_times = set()
+            for record, record_time in zip(records, record_times):
+                # The same record can appear twice in one response, and one INSERT
+                # can't touch the same conflict key twice
+                if record_time in seen_times:
+                    continue
+                seen_times.add(record_time)
+
+                # Map TTLock record type to our action
+                unlock_method = record.get('method', 0)
+                action = _record_action(unlock_method)
+
+                # Match the access code for password unlocks
+                access_code_id = None
+                if unlock_method == 1 and record.get('password'):
+                    access_code_id = access_code_ids.get(str(record.get('password')))
+
+                new_logs.append({
+                    'smart_lock_id': smart_lock.id,
+                    'access_code_id': access_code_id,
+                    'action': action,
+                    'timestamp': record_time,
+                    'user_info': record
+                })
+
+            # One INSERT for the batch; records already logged are skipped by the
+            # unique lock/timestamp instead of a lookup beforehand
+            result = db.session.execute(
+                insert(AccessLog).values(new_logs).on_conflict_do_nothing(
+                    index_elements=['smart_lock_id', 'timestamp']
+                )
+            )
+            logs_created = result.rowcount
 
             if logs_created > 0:
                 db.session.commit()
@@ -638,5 +914,13 @@ class TTLockService:
             db.session.rollback()
             return 0
 
-# Global service instance
-ttlock_service = TTLockService()
\ No newline at end of file
+# Global service instance, for code running outside an app context
+ttlock_service = TTLockService()
+
+def get_ttlock_service() -> TTLockService:
+    """TTLock service for the current app context, so user and token state isn't shared between requests"""
+    if not has_app_context():
+        return ttlock_service
+    if 'ttlock_service' not in g:
+        g.ttlock_service = TTLockService()
+    return g.ttlock_service
\ No newline at end of file
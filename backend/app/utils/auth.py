@@ -1,45 +1,54 @@
 import os
-import json
-from functools import wraps
+import hashlib
+import threading
+import time
+from functools import lru_cache, wraps
+from cachetools import TTLCache
+import orjson
 from flask import request, jsonify, current_app, g
-import firebase_admin
-from firebase_admin import credentials, auth
 import logging
-from flask import g
-from functools import wraps
-from firebase_admin import auth
 from ..models import User, db
 from .messaging import create_default_verification_templates
+from .database import get_user_by_firebase_uid
 import uuid
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
-# Debug: Print environment variables
-logger.debug("FIREBASE_ADMIN_SDK_JSON: %s", bool(os.getenv('FIREBASE_ADMIN_SDK_JSON')))
-logger.debug("FIREBASE_SERVICE_ACCOUNT_PATH: %s", os.getenv('FIREBASE_SERVICE_ACCOUNT_PATH'))
+def _unescape_private_key(private_key):
+    """Turn literal \\n sequences from a single-line env var into real newlines"""
+    # Keys pasted with real newlines need no scan over the whole PEM
+    if '\n' in private_key:
+        return private_key
+    return private_key.replace('\\n', '\n')
+
+@lru_cache(maxsize=1)
+def _build_firebase_credential():
+    """
+    Service account credential from the Firebase environment variables.
+    Parsed once per process; a failed initialize_app retry reuses it.
+    """
+    from firebase_admin import credentials
 
-# Initialize Firebase Admin SDK
-try:
     # Try individual Firebase config variables first (more reliable for Railway)
     firebase_project_id = os.getenv('FIREBASE_PROJECT_ID')
     firebase_private_key = os.getenv('FIREBASE_PRIVATE_KEY')
     firebase_client_email = os.getenv('FIREBASE_CLIENT_EMAIL')
-    
+
     if firebase_project_id and firebase_private_key and firebase_client_email:
         logger.debug("Using individual Firebase environment variables")
         cred_dict = {
             "type": "service_account",
             "project_id": firebase_project_id,
-            "private_key": firebase_private_key.replace('\\n', '\n'),
+            "private_key": _unescape_private_key(firebase_private_key),
             "client_email": firebase_client_email,
             "client_id": "",
             "auth_uri": "https://accounts.google.com/o/oauth2/auth",
             "token_uri": "https://oauth2.googleapis.com/token",
             "auth_provider_x509_cert_url": "https://www.googleapis.com/oauth2/v1/certs"
         }
-        cred = credentials.Certificate(cred_dict)
+        return credentials.Certificate(cred_dict)
     # Fallback to JSON from environment variable
     elif os.getenv('FIREBASE_ADMIN_SDK_JSON'):
         cred_json = os.getenv('FIREBASE_ADMIN_SDK_JSON')
@@ -47,15 +56,15 @@ try:
         # Clean and validate the JSON string
         try:
             # First try direct parsing
-            cred_dict = json.loads(cred_json)
-            cred = credentials.Certificate(cred_dict)
-        except json.JSONDecodeError:
+            cred_dict = orjson.loads(cred_json)
+            return credentials.Certificate(cred_dict)
+        except orjson.JSONDecodeError:
             # If that fails, try handling escaped characters
             cred_json_cleaned = cred_json.replace('\\n', '\n').replace('\\"', '"')
             try:
-                cred_dict = json.loads(cred_json_cleaned)
-                cred = credentials.Certificate(cred_dict)
-            except json.JSONDecodeError as e:
+                cred_dict = orjson.loads(cred_json_cleaned)
+                return credentials.Certificate(cred_dict)
+            except orjson.JSONDecodeError as e:
                 logger.error("Failed to parse Firebase JSON even after cleaning: %s", str(e))
                 logger.error("JSON string length: %d, error at position: %d", len(cred_json), getattr(e, 'pos', -1))
                 if hasattr(e, 'pos') and e.pos < len(cred_json):
@@ -64,7 +73,7 @@ try:
                 logger.warning("Falling back to service account file due to JSON parsing error")
                 service_account_path = os.getenv('FIREBASE_SERVICE_ACCOUNT_PATH')
                 if service_account_path and os.path.exists(service_account_path):
-                    cred = credentials.Certificate(service_account_path)
+                    return credentials.Certificate(service_account_path)
                 else:
                     raise
     else:
@@ -72,20 +81,108 @@ try:
         service_account_path = os.getenv('FIREBASE_SERVICE_ACCOUNT_PATH')
         if not service_account_path:
             raise ValueError("Neither FIREBASE_ADMIN_SDK_JSON nor FIREBASE_SERVICE_ACCOUNT_PATH are set")
-        cred = credentials.Certificate(service_account_path)
-    
-    if not firebase_admin._apps:
-        firebase_admin.initialize_app(cred)
-        logger.debug("Firebase initialized successfully")
+        return credentials.Certificate(service_account_path)
+
+_firebase_init_lock = threading.Lock()
+
+@lru_cache(maxsize=1)
+def _ensure_firebase_app():
+    """
+    Initialize the Firebase Admin app on first use rather than at import, so workers
+    and routes that never verify a token skip loading the SDK and the credentials.
+    A failed attempt is not cached and is retried on the next call.
+    """
+    import firebase_admin
+
+    logger.debug("FIREBASE_ADMIN_SDK_JSON: %s", bool(os.getenv('FIREBASE_ADMIN_SDK_JSON')))
+    logger.debug("FIREBASE_SERVICE_ACCOUNT_PATH: %s", os.getenv('FIREBASE_SERVICE_ACCOUNT_PATH'))
+
+    # Already initialized (e.g. by a script importing firebase_admin directly)
+    if firebase_admin._apps:
+        return
+
+    try:
+        cred = _build_firebase_credential()
+
+        # Two threads can race through the first call; only one may initialize
+        with _firebase_init_lock:
+            if not firebase_admin._apps:
+                firebase_admin.initialize_app(cred)
+                logger.debug("Firebase initialized successfully")
+
+    except Exception as e:
+        logger.error("Firebase initialization error: %s", str(e))
+        raise
+
+class FirebaseUnavailableError(RuntimeError):
+    """The Firebase Admin SDK could not be loaded or initialized"""
+
+# After a failed initialization, fail fast instead of re-reading the credentials
+# on every request until this many seconds have passed
+_FIREBASE_INIT_RETRY_SECONDS = 30
+_firebase_init_retry_at = 0.0
+
+def firebase_config_present():
+    """Whether any of the supported Firebase credential sources is configured"""
+    return bool(
+        (os.getenv('FIREBASE_PROJECT_ID') and os.getenv('FIREBASE_PRIVATE_KEY')
+         and os.getenv('FIREBASE_CLIENT_EMAIL'))
+        or os.getenv('FIREBASE_ADMIN_SDK_JSON')
+        or os.getenv('FIREBASE_SERVICE_ACCOUNT_PATH')
+    )
+
+def _fb_auth():
+    """The firebase_admin.auth module, with the Firebase app initialized"""
+    global _firebase_init_retry_at
+    if time.monotonic() < _firebase_init_retry_at:
+        raise FirebaseUnavailableError("Firebase initialization failed recently")
+    try:
+        from firebase_admin import auth
+        _ensure_firebase_app()
+    except Exception as e:
+        _firebase_init_retry_at = time.monotonic() + _FIREBASE_INIT_RETRY_SECONDS
+        raise FirebaseUnavailableError(str(e)) from e
+    return auth
+
+# Claims of decoded ID tokens keyed by a hash of the raw token, so repeat requests skip
+# the signature check. Entries are only reused while the token has 30s of life left.
+_decoded_token_cache = TTLCache(maxsize=10000, ttl=300)
+_decoded_token_lock = threading.Lock()
+_TOKEN_EXPIRY_MARGIN = 30
 
-except Exception as e:
-    logger.error("Firebase initialization error: %s", str(e))
-    raise
+# Ask Firebase whether the token was revoked on every request (slower, never cached)
+FIREBASE_CHECK_REVOKED = os.getenv('FIREBASE_CHECK_REVOKED', 'false').lower() == 'true'
+
+_CACHED_CLAIMS = ('uid', 'email', 'name', 'exp')
+
+def verify_id_token_cached(token):
+    """
+    auth.verify_id_token() with an in-process cache of successfully decoded tokens.
+    Cache hits carry only the uid, email, name and exp claims.
+    """
+    if FIREBASE_CHECK_REVOKED:
+        return _fb_auth().verify_id_token(token, check_revoked=True)
+
+    key = hashlib.sha256(token.encode()).digest()
+    with _decoded_token_lock:
+        claims = _decoded_token_cache.get(key)
+        if claims is not None and claims['exp'] <= time.time() + _TOKEN_EXPIRY_MARGIN:
+            del _decoded_token_cache[key]
+            claims = None
+    if claims is not None:
+        return claims
+
+    decoded_token = _fb_auth().verify_id_token(token)
+    claims = {claim: decoded_token.get(claim) for claim in _CACHED_CLAIMS}
+    if claims['exp']:
+        with _decoded_token_lock:
+            _decoded_token_cache[key] = claims
+    return decoded_token
 
 def verify_firebase_token(token):
     """Verify a Firebase ID token and return the decoded token"""
     try:
-        decoded_token = auth.verify_id_token(token)
+        decoded_token = verify_id_token_cached(token)
         return decoded_token['uid']
     except Exception as e:
         logger.error(f"Token verification error: {str(e)}")
@@ -99,22 +196,24 @@ def require_auth(f):
     """Decorator to require Firebase authentication"""
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        # Skip authentication for OPTIONS requests
-        if request.method == 'OPTIONS':
-            response = jsonify({'status': 'ok'})
-            response.headers.add('Access-Control-Allow-Methods', 'GET, POST, PUT, DELETE, OPTIONS')
-            response.headers.add('Access-Control-Allow-Headers', 'Content-Type, Authorization, X-Requested-With, Accept')
-            response.headers.add('Access-Control-Max-Age', '86400')  # Cache preflight requests for 24 hours
-            return response, 200
-            
+        # Already verified for this request (e.g. require_host wrapping require_auth)
+        if hasattr(g, 'user_id'):
+            return f(*args, **kwargs)
+
         auth_header = request.headers.get('Authorization')
         if not auth_header or not auth_header.startswith('Bearer '):
             return jsonify({'success': False, 'error': 'No token provided'}), 401
 
-        token = auth_header.split('Bearer ')[1]
+        token = auth_header[7:]  # Length of the 'Bearer ' prefix checked above
+        try:
+            fb_auth = _fb_auth()
+        except FirebaseUnavailableError as e:
+            current_app.logger.error(f"Firebase unavailable: {str(e)}")
+            return jsonify({'success': False, 'error': 'Authentication service unavailable'}), 503
+
         try:
-            # Verify the Firebase ID token
-            decoded_token = auth.verify_id_token(token)
+            # Verify the Firebase ID token (cached per token until close to expiry)
+            decoded_token = verify_id_token_cached(token)
             
             # Store user info in Flask's g object
             g.user_id = decoded_token['uid']
@@ -127,11 +226,11 @@ def require_auth(f):
             # Call the protected function
             return f(*args, **kwargs)
             
-        except auth.ExpiredIdTokenError:
+        except fb_auth.ExpiredIdTokenError:
             return jsonify({'success': False, 'error': 'Token has expired'}), 401
-        except auth.RevokedIdTokenError:
+        except fb_auth.RevokedIdTokenError:
             return jsonify({'success': False, 'error': 'Token has been revoked'}), 401
-        except auth.InvalidIdTokenError:
+        except fb_auth.InvalidIdTokenError:
             return jsonify({'success': False, 'error': 'Invalid token'}), 401
         except Exception as e:
             current_app.logger.error(f"Auth error: {str(e)}")
@@ -139,18 +238,41 @@ def require_auth(f):
 
     return decorated_function
 
+def get_request_user():
+    """Resolve the authenticated user's record, querying at most once per request"""
+    if getattr(g, 'current_user', None) is None and hasattr(g, 'user_id'):
+        g.current_user = get_user_by_firebase_uid(g.user_id)
+    return getattr(g, 'current_user', None)
+
+def require_host(f):
+    """Decorator to require Firebase authentication and a host user record.
+    The user is looked up once per request and stored on g.current_user."""
+    @wraps(f)
+    @require_auth
+    def decorated_function(*args, **kwargs):
+        if not get_request_user():
+            return jsonify({'success': False, 'error': 'User not found'}), 404
+
+        return f(*args, **kwargs)
+
+    return decorated_function
+
 def get_current_user():
     """Get current authenticated user info"""
     return g.user if hasattr(g, 'user') else None
 
 def initialize_firebase():
     """Legacy function for backward compatibility"""
-    return True if firebase_admin._apps else False
+    try:
+        _ensure_firebase_app()
+        return True
+    except Exception:
+        return False
 
 def get_user_info(user_id):
     """Legacy function for backward compatibility"""
     try:
-        user = auth.get_user(user_id)
+        user = _fb_auth().get_user(user_id)
         return {
             'uid': user.uid,
             'email': user.email,
@@ -165,7 +287,7 @@ def get_or_create_user(firebase_user):
     """Get or create a user record from Firebase user data"""
     try:
         # Check if user exists
-        user = User.query.filter_by(firebase_uid=firebase_user.uid).first()
+        user = get_user_by_firebase_uid(firebase_user.uid)
         
         if user:
             return user.to_dict()
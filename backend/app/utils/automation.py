@@ -1,6 +1,13 @@
+import logging
 from datetime import datetime, timedelta, timezone
 import uuid
-from ..models import db, MessageTemplate, ScheduledMessage, Guest, Contract, ContractTemplate, VerificationLink
+from sqlalchemy import exists, insert
+from ..models import db, MessageTemplate, ScheduledMessage, Guest, Reservation, Property, Contract, ContractTemplate, VerificationLink
+
+logger = logging.getLogger(__name__)
+
+# trigger_offset_unit -> timedelta keyword; other units leave the offset at zero
+_OFFSET_UNITS = {'days': 'days', 'hours': 'hours'}
 
 class AutomationService:
     @staticmethod
@@ -8,88 +15,118 @@ class AutomationService:
         """
         Schedules messages for a specific event type (e.g., 'check_in', 'verification').
         """
+        return AutomationService.schedule_messages_for_events(guest_id, (event_type,))
+
+    @staticmethod
+    def schedule_messages_for_events(guest_id, event_types=('check_in', 'check_out')):
+        """
+        Schedules messages for several event types in one pass: one guest lookup,
+        one template query, one duplicate check and a single commit.
+        """
+        event_label = ', '.join(event_types)
         try:
-            guest = Guest.query.get(guest_id)
-            if not guest or not guest.reservation:
-                print(f"Automation Error: Guest or reservation not found for guest_id {guest_id}")
+            # Only a few columns are read, so fetch them in one joined query
+            # instead of loading the guest and lazy-loading reservation and property
+            guest = db.session.query(
+                Guest.id,
+                Guest.reservation_id,
+                Reservation.check_in,
+                Reservation.check_out,
+                Property.user_id
+            ).join(
+                Reservation, Guest.reservation_id == Reservation.id
+            ).join(
+                Property, Reservation.property_id == Property.id
+            ).filter(Guest.id == guest_id).first()
+
+            if not guest:
+                logger.warning("Automation: guest or reservation not found for guest_id %s", guest_id)
                 return []
 
-            user_id = guest.reservation.property.user_id
+            user_id = guest.user_id
             
-            # Find templates for the specific event
-            templates = MessageTemplate.query.filter_by(
-                user_id=user_id,
-                active=True,
-                trigger_event=event_type
+            # Find templates for the requested events, keeping them in event order
+            templates = MessageTemplate.query.filter(
+                MessageTemplate.user_id == user_id,
+                MessageTemplate.active == True,
+                MessageTemplate.trigger_event.in_(event_types)
             ).all()
+            templates.sort(key=lambda template: event_types.index(template.trigger_event))
 
-            print(f"DEBUG: Found {len(templates)} templates for event '{event_type}' for user {user_id}")
+            logger.debug("Found %d templates for event '%s' for user %s", len(templates), event_label, user_id)
             if not templates:
-                print(f"DEBUG: No automated templates found for event '{event_type}' for user {user_id}.")
-                # Also check if there are any templates at all for this user
-                all_templates = MessageTemplate.query.filter_by(user_id=user_id).all()
-                print(f"DEBUG: User has {len(all_templates)} total templates")
-                for t in all_templates:
-                    print(f"DEBUG: Template: {t.name}, type: {t.template_type}, trigger: {t.trigger_event}, active: {t.active}")
+                logger.debug("No automated templates found for event '%s' for user %s", event_label, user_id)
+                # Also list the user's templates, but only query them when debug logging is on
+                if logger.isEnabledFor(logging.DEBUG):
+                    all_templates = MessageTemplate.query.filter_by(user_id=user_id).all()
+                    logger.debug("User has %d total templates", len(all_templates))
+                    for t in all_templates:
+                        logger.debug("Template: %s, type: %s, trigger: %s, active: %s",
+                                     t.name, t.template_type, t.trigger_event, t.active)
                 return []
 
-            scheduled_messages = []
+            # Templates already scheduled for this guest, in one IN query instead of one per template
+            already_scheduled = {
+                template_id for (template_id,) in db.session.query(ScheduledMessage.template_id).filter(
+                    ScheduledMessage.guest_id == guest.id,
+                    ScheduledMessage.template_id.in_([template.id for template in templates])
+                )
+            }
+
+            now = datetime.now(timezone.utc)
+            base_times = {
+                'check_in': guest.check_in,
+                'check_out': guest.check_out,
+                'verification': now  # For verification, schedule immediately
+            }
+
+            scheduled_rows = []
             for template in templates:
-                base_time = None
-                if template.trigger_event == 'check_in':
-                    base_time = guest.reservation.check_in
-                elif template.trigger_event == 'check_out':
-                    base_time = guest.reservation.check_out
-                elif template.trigger_event == 'verification':
-                    # For verification, schedule immediately
-                    base_time = datetime.now(timezone.utc)
-                
+                base_time = base_times.get(template.trigger_event)
                 if not base_time:
                     continue
 
                 scheduled_for = base_time
                 if template.trigger_event != 'verification':
-                    offset = timedelta()
-                    if template.trigger_offset_unit == 'days':
-                        offset = timedelta(days=template.trigger_offset_value)
-                    elif template.trigger_offset_unit == 'hours':
-                        offset = timedelta(hours=template.trigger_offset_value)
-                    
-                    scheduled_for = base_time - offset if template.trigger_direction == 'before' else base_time + offset
+                    unit = _OFFSET_UNITS.get(template.trigger_offset_unit)
+                    offset = timedelta(**{unit: template.trigger_offset_value}) if unit else timedelta()
+                    direction_sign = -1 if template.trigger_direction == 'before' else 1
+                    scheduled_for = base_time + direction_sign * offset
 
                 # Avoid scheduling messages in the past
-                if scheduled_for < datetime.now(timezone.utc):
-                    print(f"Skipping template '{template.name}' as its scheduled time is in the past.")
+                if scheduled_for < now:
+                    logger.debug("Skipping template '%s' as its scheduled time is in the past", template.name)
                     continue
 
                 # Avoid creating duplicate scheduled messages
-                existing_scheduled = ScheduledMessage.query.filter_by(
-                    template_id=template.id,
-                    guest_id=guest.id
-                ).first()
-
-                if existing_scheduled:
-                    print(f"Message for template '{template.name}' already scheduled for this guest. Skipping.")
+                if template.id in already_scheduled:
+                    logger.debug("Message for template '%s' already scheduled for this guest, skipping", template.name)
                     continue
 
-                new_scheduled_message = ScheduledMessage(
-                    template_id=template.id,
-                    reservation_id=guest.reservation_id,
-                    guest_id=guest.id,
-                    scheduled_for=scheduled_for,
-                    status='scheduled',
-                    channels=template.channels
-                )
-                db.session.add(new_scheduled_message)
-                scheduled_messages.append(new_scheduled_message)
+                scheduled_rows.append({
+                    'template_id': template.id,
+                    'reservation_id': guest.reservation_id,
+                    'guest_id': guest.id,
+                    'scheduled_for': scheduled_for,
+                    'status': 'scheduled',
+                    'channels': template.channels
+                })
+
+            # Write all rows in a single multi-VALUES INSERT instead of one flush per message
+            scheduled_ids = []
+            if scheduled_rows:
+                scheduled_ids = db.session.scalars(
+                    insert(ScheduledMessage).returning(ScheduledMessage.id),
+                    scheduled_rows
+                ).all()
 
             db.session.commit()
-            print(f"Successfully scheduled {len(scheduled_messages)} messages for event '{event_type}' for guest {guest_id}.")
-            return [str(msg.id) for msg in scheduled_messages]
+            logger.info("Scheduled %d messages for event '%s' for guest %s", len(scheduled_ids), event_label, guest_id)
+            return [str(message_id) for message_id in scheduled_ids]
 
-        except Exception as e:
+        except Exception:
             db.session.rollback()
-            print(f"Error in schedule_messages_for_event: {e}")
+            logger.exception("schedule_messages_for_events failed for guest %s", guest_id)
             return []
 
     @staticmethod
@@ -97,13 +134,12 @@ class AutomationService:
         """
         Schedules all applicable messages for a guest based on check-in and check-out.
         """
-        check_in_ids = AutomationService.schedule_messages_for_event(guest_id, 'check_in')
-        check_out_ids = AutomationService.schedule_messages_for_event(guest_id, 'check_out')
+        scheduled_ids = AutomationService.schedule_messages_for_events(guest_id, ('check_in', 'check_out'))
         
         # Also create contract if needed
         AutomationService.create_contract_for_guest(guest_id)
         
-        return check_in_ids + check_out_ids
+        return scheduled_ids
     
     @staticmethod
     def create_contract_for_guest(guest_id):
@@ -113,14 +149,14 @@ class AutomationService:
         try:
             guest = Guest.query.get(guest_id)
             if not guest or not guest.reservation:
-                print(f"Contract Creation Error: Guest or reservation not found for guest_id {guest_id}")
+                logger.warning("Contract creation: guest or reservation not found for guest_id %s", guest_id)
                 return None
 
             property = guest.reservation.property
             
             # Check if property has auto contract enabled
             if not property.auto_contract:
-                print(f"Auto contract disabled for property {property.name}")
+                logger.debug("Auto contract disabled for property %s", property.name)
                 return None
                 
             # Check if contract already exists
@@ -130,7 +166,7 @@ class AutomationService:
             ).first()
             
             if existing_contract:
-                print(f"Contract already exists for guest {guest_id}")
+                logger.debug("Contract already exists for guest %s", guest_id)
                 return str(existing_contract.id)
             
             # Get contract template for the property
@@ -146,7 +182,7 @@ class AutomationService:
                 ).first()
             
             if not template:
-                print(f"No contract template found for property {property.name}")
+                logger.warning("No contract template found for property %s", property.name)
                 return None
             
             # Create contract
@@ -160,34 +196,35 @@ class AutomationService:
             db.session.add(contract)
             db.session.commit()
             
-            print(f"Successfully created contract {contract.id} for guest {guest_id}")
+            logger.info("Created contract %s for guest %s", contract.id, guest_id)
             
             # Schedule contract SMS (worker will send it)
             AutomationService.schedule_contract_sms(guest, contract)
             
             return str(contract.id)
             
-        except Exception as e:
+        except Exception:
             db.session.rollback()
-            print(f"Error creating contract for guest {guest_id}: {e}")
+            logger.exception("Error creating contract for guest %s", guest_id)
             return None
     
     @staticmethod
     def schedule_contract_sms(guest, contract):
         """
-        Schedule SMS notification for contract signing
+        Schedule SMS notification for contract signing.
+        The link, any new template and the message are committed together.
         """
         try:
             property = guest.reservation.property
             
-            # Check if we already have a verification link for this contract
-            existing_link = VerificationLink.query.filter_by(
-                guest_id=guest.id,
-                contract_generated=True
-            ).first()
+            # Check if we already have a verification link for this contract (SELECT EXISTS, no row load)
+            link_exists = db.session.query(exists().where(
+                VerificationLink.guest_id == guest.id,
+                VerificationLink.contract_generated == True
+            )).scalar()
             
-            if existing_link:
-                print(f"Contract verification link already exists for guest {guest.id}")
+            if link_exists:
+                logger.debug("Contract verification link already exists for guest %s", guest.id)
                 return True
             
             # Create a verification link for the contract
@@ -199,7 +236,6 @@ class AutomationService:
                 contract_generated=True
             )
             db.session.add(verification_link)
-            db.session.commit()
 
             # Find or use reusable contract SMS template
             template = MessageTemplate.query.filter_by(
@@ -221,12 +257,12 @@ class AutomationService:
                     trigger_event='verification'
                 )
                 db.session.add(template)
-                db.session.commit()
+                db.session.flush()  # template.id is generated by the database
 
             # Schedule the SMS to be sent immediately
             message = ScheduledMessage(
                 template_id=template.id,
-                reservation_id=guest.reservation.id,
+                reservation_id=guest.reservation_id,
                 guest_id=guest.id,
                 status='scheduled',
                 scheduled_for=datetime.now(timezone.utc) + timedelta(minutes=1),
@@ -235,10 +271,10 @@ class AutomationService:
             db.session.add(message)
             db.session.commit()
             
-            print(f"Successfully scheduled contract SMS for guest {guest.id}")
+            logger.info("Scheduled contract SMS for guest %s", guest.id)
             return True
             
-        except Exception as e:
+        except Exception:
             db.session.rollback()
-            print(f"Error scheduling contract SMS for guest {guest.id}: {e}")
+            logger.exception("Error scheduling contract SMS for guest %s", guest.id)
             return False
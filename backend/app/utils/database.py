@@ -6,8 +6,52 @@ Updated to support property-centric architecture with reservations and contracts
 from datetime import datetime, timezone, timedelta
 from ..models import db, User, Property, Reservation, Guest, VerificationLink, Contract, ContractTemplate, SyncLog, MessageTemplate
 from ..constants import TEMPLATE_TYPES # Import from the new central location
+from cachetools import TTLCache
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+import threading
 import uuid
 
+# Short-lived token lookups for the public guest routes. Entries hold plain
+# data only (never ORM instances) so they are safe to share across sessions.
+_token_cache = TTLCache(maxsize=4096, ttl=30)
+_token_cache_lock = threading.Lock()
+
+# In-flight token lookups, so concurrent requests for one token share a single query
+_inflight_lookups = {}
+_inflight_lock = threading.Lock()
+
+# How long a follower waits on the leader's query before running its own
+_COALESCE_WAIT_SECONDS = 10
+
+def _coalesced(key, loader):
+    """
+    Run loader() once for all concurrent callers asking for the same key
+    """
+    with _inflight_lock:
+        future = _inflight_lookups.get(key)
+        is_leader = future is None
+        if is_leader:
+            future = Future()
+            _inflight_lookups[key] = future
+
+    if not is_leader:
+        try:
+            return future.result(timeout=_COALESCE_WAIT_SECONDS)
+        except FutureTimeoutError:
+            return loader()
+
+    try:
+        result = loader()
+        future.set_result(result)
+        return result
+    except BaseException as e:
+        # Also covers interrupts and worker timeouts, so followers never wait forever
+        future.set_exception(e)
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight_lookups.pop(key, None)
+
 # User Management
 def create_user(firebase_uid, email, name, **kwargs):
     """
@@ -111,10 +155,20 @@ Le bailleurLe locataire
 
 def get_user_by_firebase_uid(firebase_uid):
     """
-    Get user by Firebase UID
+    Get user by Firebase UID.
+    Found users are remembered on the current session (not across requests, since they
+    are ORM instances), so repeat lookups within a request skip the SELECT.
     """
     try:
+        users_by_uid = db.session.info.setdefault('users_by_firebase_uid', {})
+        user = users_by_uid.get(firebase_uid)
+        # A user deleted or expunged since it was cached is looked up again
+        if user is not None and user in db.session:
+            return user
+
         user = User.query.filter_by(firebase_uid=firebase_uid).first()
+        if user:
+            users_by_uid[firebase_uid] = user
         return user if user else None
 
     except Exception as e:
@@ -335,6 +389,32 @@ def get_user_reservations(user_id, page=1, per_page=10, search_query=None, prope
         print(f"Database error: {str(e)}")
         return {'reservations': [], 'total': 0, 'pages': 0, 'current_page': 1}
 
+def get_reservation_for_user(reservation_id, user_id):
+    """
+    Get a single reservation, only if it belongs to one of the user's properties
+    """
+    try:
+        reservation_uuid = uuid.UUID(reservation_id) if isinstance(reservation_id, str) else reservation_id
+        user_uuid = uuid.UUID(user_id) if isinstance(user_id, str) else user_id
+
+        reservation = (db.session.query(Reservation)
+                       .join(Property)
+                       .options(db.joinedload(Reservation.property))
+                       .filter(Reservation.id == reservation_uuid, Property.user_id == user_uuid)
+                       .first())
+        if not reservation:
+            return None
+
+        now = datetime.now(timezone.utc)
+        reservation_dict = reservation.to_dict()
+        if reservation.check_in <= now <= reservation.check_out:
+            reservation_dict['status'] = 'active'
+        return reservation_dict
+
+    except Exception as e:
+        print(f"Database error: {str(e)}")
+        return None
+
 # Guest Management (Updated for new structure)
 def create_guest(reservation_id, **kwargs):
     """
@@ -499,16 +579,72 @@ def create_verification_link(guest_id, token, expires_at):
 
 def get_verification_link(token):
     """
-    Get verification link by token
+    Get verification link by token (cached for a few seconds per token)
     """
-    try:
+    cache_key = ('link', token)
+    with _token_cache_lock:
+        cached = _token_cache.get(cache_key)
+    if cached is not None:
+        # Copy so callers can't change the shared entry
+        return dict(cached)
+
+    def load_link():
         verification_link = VerificationLink.query.filter_by(token=token).first()
-        return verification_link.to_dict() if verification_link else None
+        if not verification_link:
+            return None
+        link_info = verification_link.to_dict()
+        # Keep expiry as a datetime so validity checks are a plain comparison
+        link_info['expires_at'] = verification_link.expires_at
+        return link_info
+
+    try:
+        link_info = _coalesced(cache_key, load_link)
+        if not link_info:
+            return None
+
+        with _token_cache_lock:
+            _token_cache[cache_key] = link_info
+        return dict(link_info)
     
     except Exception as e:
         print(f"Database error: {str(e)}")
         return None
 
+def get_guest_by_verification_token(token):
+    """
+    Get the guest holding a verification token. The token -> guest id mapping
+    is cached briefly so repeat hits become a primary-key lookup.
+    """
+    cache_key = ('guest', token)
+    with _token_cache_lock:
+        guest_id = _token_cache.get(cache_key)
+    if guest_id is not None:
+        guest = db.session.get(Guest, guest_id)
+        if guest and guest.verification_token == token:
+            return guest
+
+    def load_guest_id():
+        guest = Guest.query.filter_by(verification_token=token).first()
+        return guest.id if guest else None
+
+    guest_id = _coalesced(cache_key, load_guest_id)
+    if guest_id is None:
+        return None
+
+    with _token_cache_lock:
+        _token_cache[cache_key] = guest_id
+    return db.session.get(Guest, guest_id)
+
+def invalidate_verification_token(token):
+    """
+    Drop any cached lookups for a token after its link or guest changed
+    """
+    if not token:
+        return
+    with _token_cache_lock:
+        _token_cache.pop(('link', token), None)
+        _token_cache.pop(('guest', token), None)
+
 # Sync Logging
 def create_sync_log(property_id, sync_type, status, **kwargs):
     """
@@ -616,8 +752,24 @@ def get_user_verification_links(user_id):
     Get all verification links for a user
     """
     try:
-        verification_links = VerificationLink.query.filter_by(user_id=user_id).order_by(VerificationLink.created_at.desc()).all()
-        return [link.to_dict() for link in verification_links]
+        user_uuid = uuid.UUID(user_id) if isinstance(user_id, str) else user_id
+
+        # Single JOIN across guests/reservations/properties instead of walking guest.verification_links
+        rows = (db.session.query(VerificationLink, Guest.full_name, Guest.reservation_id)
+                .join(Guest, Guest.id == VerificationLink.guest_id)
+                .join(Reservation, Reservation.id == Guest.reservation_id)
+                .join(Property, Property.id == Reservation.property_id)
+                .filter(Property.user_id == user_uuid)
+                .order_by(VerificationLink.created_at.desc())
+                .all())
+
+        links = []
+        for link, guest_name, reservation_id in rows:
+            link_dict = link.to_dict()
+            link_dict['guest_name'] = guest_name
+            link_dict['reservation_id'] = str(reservation_id)
+            links.append(link_dict)
+        return links
     
     except Exception as e:
         print(f"Database error: {str(e)}")
@@ -634,6 +786,7 @@ def use_verification_link(token, guest_id):
             verification_link.guest_id = uuid.UUID(guest_id) if isinstance(guest_id, str) else guest_id
             verification_link.used_at = datetime.now(timezone.utc)
             db.session.commit()
+            invalidate_verification_token(token)
             return True
         return False
     
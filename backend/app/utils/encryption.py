@@ -4,6 +4,7 @@ Encryption utilities for securely storing sensitive data like TTLock credentials
 
 import os
 import base64
+import hashlib
 from cryptography.fernet import Fernet
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
@@ -56,5 +57,9 @@ class CredentialEncryption:
             logger.error(f"Decryption failed: {str(e)}")
             return None
 
+def ttlock_password_md5(password: str) -> str:
+    """MD5 hex digest TTLock's OAuth expects in place of the password (not a security hash)"""
+    return hashlib.md5(password.encode(), usedforsecurity=False).hexdigest()
+
 # Global instance
 credential_encryption = CredentialEncryption()
\ No newline at end of file
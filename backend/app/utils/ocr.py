@@ -3,6 +3,11 @@ from PIL import Image, ImageEnhance, ImageFilter, ImageOps
 import re
 from datetime import datetime
 import logging
+import os
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
 import numpy as np
 import cv2
 
@@ -10,9 +15,49 @@ import cv2
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
-def process_id_document(image_path):
+OCR_TIMEOUT_SECONDS = 30
+
+# OCR processes per web worker; every gunicorn worker gets its own pool, so keep it small
+OCR_MAX_WORKERS = int(os.getenv('OCR_MAX_WORKERS', '2'))
+
+class OCRTimeoutError(Exception):
+    """OCR did not finish within its time budget"""
+
+# OCR is CPU-bound, so it runs in worker processes instead of the request thread.
+# They start from a forkserver rather than forking this process, which has request
+# threads and open database connections.
+_ocr_pool = None
+_ocr_pool_lock = threading.Lock()
+
+def get_ocr_pool():
+    """Create the OCR process pool on first use"""
+    global _ocr_pool
+    with _ocr_pool_lock:
+        if _ocr_pool is None:
+            _ocr_pool = ProcessPoolExecutor(
+                max_workers=OCR_MAX_WORKERS,
+                mp_context=multiprocessing.get_context('forkserver')
+            )
+    return _ocr_pool
+
+def run_id_document_ocr(image_path, timeout=OCR_TIMEOUT_SECONDS):
     """
-    Enhanced process ID document with validation and structure analysis
+    Run process_id_document in the OCR process pool and wait for its result.
+    Only the path crosses the process boundary; the worker streams the image from disk.
+    The worker gets the same deadline and stops on its own, so a job we gave up on
+    doesn't keep a pool process busy. Raises OCRTimeoutError when it runs out.
+    """
+    future = get_ocr_pool().submit(process_id_document, image_path, time.time() + timeout)
+    try:
+        return future.result(timeout=timeout)
+    except FutureTimeoutError:
+        future.cancel()  # Still queued behind other uploads: never start it
+        raise OCRTimeoutError(f"OCR did not finish within {timeout} seconds")
+
+def process_id_document(image_path, deadline=None):
+    """
+    Enhanced process ID document with validation and structure analysis.
+    deadline (a time.time() value) stops trying further OCR passes once reached.
     """
     try:
         logger.info(f"Processing ID document: {image_path}")
@@ -43,14 +88,22 @@ def process_id_document(image_path):
         ]
         
         for method_name, method_func in methods.items():
+            if deadline and time.time() >= deadline:
+                logger.warning("OCR deadline reached, keeping the best result so far")
+                break
             try:
                 processed_image = method_func(image)
                 logger.debug(f"Enhanced image for OCR: {processed_image.size}, mode: {processed_image.mode}")
                 
                 for config in configs:
+                    remaining = deadline - time.time() if deadline else None
+                    if remaining is not None and remaining <= 0:
+                        break
                     try:
-                        # Extract text
-                        text = pytesseract.image_to_string(processed_image, config=config, lang='eng+fra')
+                        # Extract text; pytesseract kills tesseract if it outlives the deadline
+                        text = pytesseract.image_to_string(
+                            processed_image, config=config, lang='eng+fra', timeout=remaining or 0
+                        )
                         
                         if text.strip():
                             # Calculate quality score
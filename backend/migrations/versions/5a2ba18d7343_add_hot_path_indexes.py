@@ -0,0 +1,37 @@
+"""add indexes for guest token lookups and passcode scheduler queries
+
+Revision ID: 5a2ba18d7343
+Revises: a982cba7e4ad
+Create Date: 2026-10-17 09:12:31.402118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5a2ba18d7343'
+down_revision = 'a982cba7e4ad'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # verification_links.token is already covered by its unique constraint
+    op.create_index('idx_guests_reservation_id', 'guests', ['reservation_id'], unique=False)
+    op.create_index('idx_guests_verification_token', 'guests', ['verification_token'], unique=False)
+    op.create_index('idx_reservations_status_check_in', 'reservations', ['status', 'check_in'], unique=False)
+    op.create_index(
+        'idx_reservation_passcodes_active_valid_until',
+        'reservation_passcodes',
+        ['status', 'valid_until'],
+        unique=False,
+        postgresql_where=sa.text("status = 'active'")
+    )
+
+
+def downgrade():
+    op.drop_index('idx_reservation_passcodes_active_valid_until', table_name='reservation_passcodes')
+    op.drop_index('idx_reservations_status_check_in', table_name='reservations')
+    op.drop_index('idx_guests_verification_token', table_name='guests')
+    op.drop_index('idx_guests_reservation_id', table_name='guests')
@@ -0,0 +1,24 @@
+"""add encrypted ttlock refresh token to users
+
+Revision ID: a4d61e9c2b83
+Revises: f3b8d05a1c47
+Create Date: 2026-10-17 16:32:11.905264
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4d61e9c2b83'
+down_revision = 'f3b8d05a1c47'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('users', sa.Column('ttlock_refresh_token_encrypted', sa.Text(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('users', 'ttlock_refresh_token_encrypted')
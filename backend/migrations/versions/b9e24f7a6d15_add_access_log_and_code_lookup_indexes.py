@@ -0,0 +1,49 @@
+"""add indexes for access log duplicate checks and access code matching
+
+Revision ID: b9e24f7a6d15
+Revises: a4d61e9c2b83
+Create Date: 2026-10-17 16:58:40.227719
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b9e24f7a6d15'
+down_revision = 'a4d61e9c2b83'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Built concurrently so webhook writes aren't blocked during the build
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'idx_access_logs_lock_timestamp',
+            'access_logs',
+            ['smart_lock_id', 'timestamp'],
+            unique=False,
+            postgresql_concurrently=True
+        )
+        op.create_index(
+            'idx_access_codes_lock_passcode_status',
+            'access_codes',
+            ['smart_lock_id', 'passcode', 'status'],
+            unique=False,
+            postgresql_concurrently=True
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'idx_access_codes_lock_passcode_status',
+            table_name='access_codes',
+            postgresql_concurrently=True
+        )
+        op.drop_index(
+            'idx_access_logs_lock_timestamp',
+            table_name='access_logs',
+            postgresql_concurrently=True
+        )
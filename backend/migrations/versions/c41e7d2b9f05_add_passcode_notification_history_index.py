@@ -0,0 +1,38 @@
+"""add partial index for host notification history
+
+Revision ID: c41e7d2b9f05
+Revises: 5a2ba18d7343
+Create Date: 2026-10-17 14:03:52.771940
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c41e7d2b9f05'
+down_revision = '5a2ba18d7343'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Built concurrently so the passcode table stays writable during the build
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'idx_rp_property_notified',
+            'reservation_passcodes',
+            ['property_id', sa.text('host_notified_at DESC')],
+            unique=False,
+            postgresql_where=sa.text('host_notified_at IS NOT NULL'),
+            postgresql_concurrently=True
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'idx_rp_property_notified',
+            table_name='reservation_passcodes',
+            postgresql_concurrently=True
+        )
@@ -0,0 +1,24 @@
+"""add encrypted ttlock password md5 to users
+
+Revision ID: c7f30b4e8a92
+Revises: b9e24f7a6d15
+Create Date: 2026-10-17 17:24:53.118604
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7f30b4e8a92'
+down_revision = 'b9e24f7a6d15'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('users', sa.Column('ttlock_password_md5_encrypted', sa.Text(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('users', 'ttlock_password_md5_encrypted')
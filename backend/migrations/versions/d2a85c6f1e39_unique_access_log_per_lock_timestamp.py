@@ -0,0 +1,57 @@
+"""make access_logs unique per lock and timestamp
+
+Revision ID: d2a85c6f1e39
+Revises: c7f30b4e8a92
+Create Date: 2026-10-17 18:06:14.530872
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2a85c6f1e39'
+down_revision = 'c7f30b4e8a92'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Racing webhook deliveries could store the same lock record twice; keep one
+    op.execute(
+        'DELETE FROM access_logs a USING access_logs b '
+        'WHERE a.smart_lock_id = b.smart_lock_id AND a.timestamp = b.timestamp AND a.id > b.id'
+    )
+
+    # Build the unique index without blocking writes, then attach it as the constraint.
+    # It covers the same columns as the plain lookup index, which is dropped.
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'uq_access_logs_lock_timestamp',
+            'access_logs',
+            ['smart_lock_id', 'timestamp'],
+            unique=True,
+            postgresql_concurrently=True
+        )
+    op.execute(
+        'ALTER TABLE access_logs '
+        'ADD CONSTRAINT uq_access_logs_lock_timestamp UNIQUE USING INDEX uq_access_logs_lock_timestamp'
+    )
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'idx_access_logs_lock_timestamp',
+            table_name='access_logs',
+            postgresql_concurrently=True
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'idx_access_logs_lock_timestamp',
+            'access_logs',
+            ['smart_lock_id', 'timestamp'],
+            unique=False,
+            postgresql_concurrently=True
+        )
+    op.drop_constraint('uq_access_logs_lock_timestamp', 'access_logs', type_='unique')
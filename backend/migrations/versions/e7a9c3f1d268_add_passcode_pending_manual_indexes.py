@@ -0,0 +1,50 @@
+"""add indexes for pending manual passcodes and reservation passcode lookups
+
+Revision ID: e7a9c3f1d268
+Revises: c41e7d2b9f05
+Create Date: 2026-10-17 15:21:07.318452
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7a9c3f1d268'
+down_revision = 'c41e7d2b9f05'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Built concurrently so the passcode table stays writable during the build
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'idx_rp_pending_manual',
+            'reservation_passcodes',
+            ['property_id'],
+            unique=False,
+            postgresql_where=sa.text("status = 'pending' AND generation_method = 'manual'"),
+            postgresql_concurrently=True
+        )
+        op.create_index(
+            'idx_rp_reservation_id',
+            'reservation_passcodes',
+            ['reservation_id'],
+            unique=False,
+            postgresql_concurrently=True
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'idx_rp_reservation_id',
+            table_name='reservation_passcodes',
+            postgresql_concurrently=True
+        )
+        op.drop_index(
+            'idx_rp_pending_manual',
+            table_name='reservation_passcodes',
+            postgresql_concurrently=True
+        )
@@ -0,0 +1,96 @@
+"""make reservation_passcodes.reservation_id unique
+
+Revision ID: f3b8d05a1c47
+Revises: e7a9c3f1d268
+Create Date: 2026-10-17 15:48:29.604117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3b8d05a1c47'
+down_revision = 'e7a9c3f1d268'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The check-then-insert race this constraint closes may already have stored two
+    # passcodes for one reservation; keep the newest one that isn't revoked.
+    # A duplicate whose TTLock codes may still open a lock must be revoked on the lock
+    # first, so abort on those; every other removed row's codes are logged as a NOTICE.
+    op.execute("""
+        DO $$
+        DECLARE
+            dup RECORD;
+        BEGIN
+            CREATE TEMP TABLE rp_duplicates ON COMMIT DROP AS
+            SELECT rp.id, rp.reservation_id, rp.generation_method, rp.status,
+                   rp.valid_until, rp.ttlock_access_codes
+            FROM reservation_passcodes rp
+            JOIN (
+                SELECT id, row_number() OVER (
+                    PARTITION BY reservation_id
+                    ORDER BY (status = 'revoked'), created_at DESC NULLS LAST, id DESC
+                ) AS rank FROM reservation_passcodes
+            ) ranked ON ranked.id = rp.id
+            WHERE ranked.rank > 1;
+
+            FOR dup IN
+                SELECT * FROM rp_duplicates
+                WHERE generation_method = 'ttlock'
+                  AND status <> 'revoked'
+                  AND ttlock_access_codes IS NOT NULL
+                  AND valid_until > now()
+            LOOP
+                RAISE EXCEPTION 'Duplicate reservation passcode % (reservation %) still has live TTLock codes %; revoke them on the lock before upgrading',
+                    dup.id, dup.reservation_id, dup.ttlock_access_codes;
+            END LOOP;
+
+            FOR dup IN SELECT * FROM rp_duplicates WHERE ttlock_access_codes IS NOT NULL LOOP
+                RAISE NOTICE 'Removing duplicate reservation passcode % (reservation %, status %) with TTLock codes %',
+                    dup.id, dup.reservation_id, dup.status, dup.ttlock_access_codes;
+            END LOOP;
+
+            DELETE FROM reservation_passcodes rp USING rp_duplicates d WHERE rp.id = d.id;
+        END
+        $$
+    """)
+
+    # Build the unique index without blocking writes, then attach it as the constraint.
+    # A failed concurrent build leaves an INVALID index behind, so clear any leftover
+    # first to make a re-run possible.
+    # The unique index covers reservation_id lookups, so the plain index is dropped.
+    with op.get_context().autocommit_block():
+        op.execute('DROP INDEX CONCURRENTLY IF EXISTS uq_rp_reservation_id')
+        op.create_index(
+            'uq_rp_reservation_id',
+            'reservation_passcodes',
+            ['reservation_id'],
+            unique=True,
+            postgresql_concurrently=True
+        )
+    op.execute(
+        'ALTER TABLE reservation_passcodes '
+        'ADD CONSTRAINT uq_rp_reservation_id UNIQUE USING INDEX uq_rp_reservation_id'
+    )
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'idx_rp_reservation_id',
+            table_name='reservation_passcodes',
+            postgresql_concurrently=True
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'idx_rp_reservation_id',
+            'reservation_passcodes',
+            ['reservation_id'],
+            unique=False,
+            postgresql_concurrently=True
+        )
+    op.drop_constraint('uq_rp_reservation_id', 'reservation_passcodes', type_='unique')
@@ -3,6 +3,8 @@ import sys
 from datetime import datetime, timezone, timedelta
 from dotenv import load_dotenv
 import time
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import update
 
 # Load environment variables first
 dotenv_path = os.path.join(os.path.dirname(__file__), '..', '.env')
@@ -15,6 +17,46 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 from app import create_app, db
 from app.models import Reservation, ReservationPasscode, Property
 from app.services.passcode_service import passcode_service
+from app.services.notification_service import notification_service
+
+# Reservations whose passcodes are generated at once; each worker holds a DB connection
+# and waits on TTLock, so keep this well under the pool size
+PASSCODE_GENERATION_MAX_WORKERS = int(os.getenv('PASSCODE_GENERATION_MAX_WORKERS', '5'))
+
+def generate_passcode_for_reservation(app, reservation_id, guest_info, property_info):
+    """
+    Generate one reservation's passcode in its own app context and session.
+    Returns the new TTLock passcode's id so its host can be notified in bulk.
+    """
+    with app.app_context():
+        try:
+            print(f"  -> Generating passcode for {guest_info} at {property_info}")
+
+            result = passcode_service.generate_reservation_passcode(reservation_id, notify_host=False)
+
+            if result.get('success'):
+                print(f"    ✓ Successfully generated passcode for reservation {reservation_id}")
+                print(f"    -> Method: {result.get('method', 'unknown')}")
+
+                if result.get('passcode'):
+                    print(f"    -> Passcode: {result.get('passcode')}")
+
+                # SMS notifications are handled automatically by the passcode service
+                if result.get('requires_manual_entry'):
+                    print(f"    -> Manual passcode entry required - SMS sent to host")
+
+                # Only TTLock passcodes are ready now; their host SMS goes out in bulk
+                if result.get('passcode'):
+                    return result.get('reservation_passcode_id')
+
+            else:
+                print(f"    ✗ Failed to generate passcode for reservation {reservation_id}: {result.get('error')}")
+
+        except Exception as e:
+            print(f"    ✗ Error generating passcode for reservation {reservation_id}: {str(e)}")
+        finally:
+            db.session.remove()
+    return None
 
 def check_passcode_generation():
     """Check for reservations that need passcode generation"""
@@ -30,23 +72,21 @@ def check_passcode_generation():
             # Find reservations that need passcode generation
             reservations_needing_passcodes = []
 
-            # Get reservations with check-in within the next 4 hours
-            upcoming_reservations = Reservation.query.filter(
+            # Get reservations with check-in within the next 4 hours that have no passcode yet,
+            # in one LEFT JOIN instead of a passcode lookup per reservation
+            upcoming_reservations = Reservation.query.outerjoin(
+                ReservationPasscode, ReservationPasscode.reservation_id == Reservation.id
+            ).filter(
                 Reservation.check_in > now,
                 Reservation.check_in <= cutoff_time,
-                Reservation.status.in_(['confirmed', 'checked_in'])  # Only process active reservations
+                Reservation.status.in_(['confirmed', 'checked_in']),  # Only process active reservations
+                ReservationPasscode.id.is_(None)
             ).all()
 
             for reservation in upcoming_reservations:
-                # Check if passcode already exists
-                existing_passcode = ReservationPasscode.query.filter_by(
-                    reservation_id=reservation.id
-                ).first()
-
-                if not existing_passcode:
-                    # Check if we should generate passcode (3 hours before check-in)
-                    if passcode_service.should_generate_passcode(reservation):
-                        reservations_needing_passcodes.append(reservation)
+                # Check if we should generate passcode (3 hours before check-in)
+                if passcode_service.should_generate_passcode(reservation, now):
+                    reservations_needing_passcodes.append(reservation)
 
             if not reservations_needing_passcodes:
                 print("No reservations need passcode generation at this time.")
@@ -54,31 +94,34 @@ def check_passcode_generation():
 
             print(f"Found {len(reservations_needing_passcodes)} reservations needing passcode generation")
 
-            # Generate passcodes for qualifying reservations
-            for reservation in reservations_needing_passcodes:
-                try:
-                    guest_info = f"guest {reservation.guest_name_partial}" if reservation.guest_name_partial else f"reservation {reservation.id}"
-                    property_info = f"{reservation.property.name}" if reservation.property else "unknown property"
-                    print(f"  -> Generating passcode for {guest_info} at {property_info}")
-
-                    result = passcode_service.generate_reservation_passcode(str(reservation.id))
-
-                    if result.get('success'):
-                        print(f"    ✓ Successfully generated passcode for reservation {reservation.id}")
-                        print(f"    -> Method: {result.get('method', 'unknown')}")
-
-                        if result.get('passcode'):
-                            print(f"    -> Passcode: {result.get('passcode')}")
-
-                        # SMS notifications are handled automatically by the passcode service
-                        if result.get('requires_manual_entry'):
-                            print(f"    -> Manual passcode entry required - SMS sent to host")
-
-                    else:
-                        print(f"    ✗ Failed to generate passcode for reservation {reservation.id}: {result.get('error')}")
-
-                except Exception as e:
-                    print(f"    ✗ Error generating passcode for reservation {reservation.id}: {str(e)}")
+            # Work from plain values so this session can be released, then overlap the
+            # TTLock round trips of several reservations instead of waiting on each in turn
+            jobs = [
+                (
+                    str(reservation.id),
+                    f"guest {reservation.guest_name_partial}" if reservation.guest_name_partial else f"reservation {reservation.id}",
+                    f"{reservation.property.name}" if reservation.property else "unknown property"
+                )
+                for reservation in reservations_needing_passcodes
+            ]
+            db.session.remove()
+
+            with ThreadPoolExecutor(
+                max_workers=min(PASSCODE_GENERATION_MAX_WORKERS, len(jobs)),
+                thread_name_prefix='passcode-generation'
+            ) as executor:
+                generated_ids = list(executor.map(lambda job: generate_passcode_for_reservation(app, *job), jobs))
+
+            # Passcode ready SMS for every new TTLock passcode, sent concurrently and
+            # stamped with one UPDATE
+            ready_ids = [passcode_id for passcode_id in generated_ids if passcode_id]
+            if ready_ids:
+                notify_result = notification_service.send_bulk_passcode_ready_notifications(ready_ids)
+                if notify_result.get('success'):
+                    print(f"Sent {len(notify_result['sent'])} passcode ready notifications "
+                          f"({len(notify_result['failed'])} failed, {len(notify_result['skipped'])} without phone)")
+                else:
+                    print(f"Error sending passcode ready notifications: {notify_result.get('error')}")
 
         except Exception as e:
             print(f"Error in passcode generation check: {str(e)}")
@@ -92,33 +135,23 @@ def cleanup_expired_passcodes():
         try:
             now = datetime.now(timezone.utc)
 
-            # Find expired passcodes that are still marked as active
-            expired_passcodes = ReservationPasscode.query.filter(
-                ReservationPasscode.valid_until < now,
-                ReservationPasscode.status == 'active'
-            ).all()
+            # Expire every active passcode past its validity in a single UPDATE.
+            # For TTLock passcodes, they should already be expired on TTLock's side.
+            result = db.session.execute(
+                update(ReservationPasscode)
+                .where(
+                    ReservationPasscode.valid_until < now,
+                    ReservationPasscode.status == 'active'
+                )
+                .values(status='expired', updated_at=now)
+            )
+            db.session.commit()
 
-            if not expired_passcodes:
+            if not result.rowcount:
                 print("No expired passcodes to clean up.")
                 return
 
-            print(f"Found {len(expired_passcodes)} expired passcodes to clean up")
-
-            for passcode in expired_passcodes:
-                try:
-                    # Update status to expired
-                    passcode.status = 'expired'
-                    passcode.updated_at = now
-
-                    # For TTLock passcodes, they should already be expired on TTLock's side
-                    print(f"  -> Marked passcode {passcode.passcode or 'pending'} as expired (reservation {passcode.reservation_id})")
-
-                except Exception as e:
-                    print(f"  ✗ Error updating expired passcode {passcode.id}: {str(e)}")
-
-            # Commit all changes
-            db.session.commit()
-            print(f"Successfully cleaned up {len(expired_passcodes)} expired passcodes")
+            print(f"Successfully cleaned up {result.rowcount} expired passcodes")
 
         except Exception as e:
             print(f"Error in passcode cleanup: {str(e)}")